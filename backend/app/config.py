@@ -32,7 +32,59 @@ class Settings:
         self.TWITCH_CLIENT_SECRET: str = os.getenv("TWITCH_CLIENT_SECRET")
         self.TOKEN_BOT_DISCORD: str = os.getenv("TOKEN_BOT_DISCORD")
         self.BOT_SECRET: str = os.getenv("BOT_SECRET")
+        self.MEMBER_UPDATE_COALESCE_SECONDS: float = float(os.getenv("MEMBER_UPDATE_COALESCE_SECONDS", "2"))
         self.TWITCH_WEBHOOK_SECRET: str = os.getenv("TWITCH_WEBHOOK_SECRET")
+        self.WORKFLOW_MAX_CONCURRENCY: int = int(os.getenv("WORKFLOW_MAX_CONCURRENCY", "50"))
+        self.WORKFLOW_MAX_CONCURRENCY_PER_USER: int = int(os.getenv("WORKFLOW_MAX_CONCURRENCY_PER_USER", "10"))
+        self.EVENT_INGESTION_MODE: str = os.getenv("EVENT_INGESTION_MODE", "inline").lower()
+        self.EVENT_WORKERS: int = int(os.getenv("EVENT_WORKERS", "4"))
+        self.EVENT_QUEUE_SIZE: int = int(os.getenv("EVENT_QUEUE_SIZE", "1000"))
+        self.EVENT_DRAIN_TIMEOUT: float = float(os.getenv("EVENT_DRAIN_TIMEOUT", "30"))
+        self.EVENT_QUEUE_BATCH_SIZE: int = int(os.getenv("EVENT_QUEUE_BATCH_SIZE", "5"))
+        self.EVENT_QUEUE_POLL_INTERVAL: float = float(os.getenv("EVENT_QUEUE_POLL_INTERVAL", "1"))
+        self.EVENT_MAX_ATTEMPTS: int = int(os.getenv("EVENT_MAX_ATTEMPTS", "5"))
+        self.EVENT_RETRY_BASE_SECONDS: float = float(os.getenv("EVENT_RETRY_BASE_SECONDS", "5"))
+        self.EVENT_RETRY_MAX_SECONDS: float = float(os.getenv("EVENT_RETRY_MAX_SECONDS", "600"))
+        self.EVENT_LEASE_SECONDS: int = int(os.getenv("EVENT_LEASE_SECONDS", "300"))
+        self.EVENT_DEDUPE_BACKEND: str = os.getenv("EVENT_DEDUPE_BACKEND", "memory").lower()
+        self.EVENT_DEDUPE_TTL_SECONDS: int = int(os.getenv("EVENT_DEDUPE_TTL_SECONDS", "600"))
+        self.EVENT_DEDUPE_MAX_ENTRIES: int = int(os.getenv("EVENT_DEDUPE_MAX_ENTRIES", "100000"))
+        self.RUN_HISTORY_ENABLED: bool = os.getenv("RUN_HISTORY_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.RUN_HISTORY_BATCH_SIZE: int = int(os.getenv("RUN_HISTORY_BATCH_SIZE", "200"))
+        self.RUN_HISTORY_FLUSH_MS: int = int(os.getenv("RUN_HISTORY_FLUSH_MS", "1000"))
+        self.RUN_HISTORY_OUTPUT_LIMIT: int = int(os.getenv("RUN_HISTORY_OUTPUT_LIMIT", "2000"))
+        self.HTTP_TIMEOUT: float = float(os.getenv("HTTP_TIMEOUT", "10"))
+        self.HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+        self.HTTP_MAX_KEEPALIVE: int = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+        self.HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+        self.HTTP_HTTP2: bool = os.getenv("HTTP_HTTP2", "false").lower() in ("1", "true", "yes")
+        self.RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.RATE_LIMIT_DEFAULT_RPS: float = float(os.getenv("RATE_LIMIT_DEFAULT_RPS", "10"))
+        self.RATE_LIMIT_MAX_RETRIES: int = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "3"))
+        self.RATE_LIMIT_MAX_WAIT: float = float(os.getenv("RATE_LIMIT_MAX_WAIT", "60"))
+        self.PROVIDER_MAX_CONCURRENCY: int = int(os.getenv("PROVIDER_MAX_CONCURRENCY", "20"))
+        self.PROVIDER_QUEUE_TIMEOUT: float = float(os.getenv("PROVIDER_QUEUE_TIMEOUT", "5"))
+        self.CIRCUIT_FAILURE_RATIO: float = float(os.getenv("CIRCUIT_FAILURE_RATIO", "0.5"))
+        self.CIRCUIT_MIN_CALLS: int = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))
+        self.CIRCUIT_WINDOW_SECONDS: float = float(os.getenv("CIRCUIT_WINDOW_SECONDS", "60"))
+        self.CIRCUIT_SLOW_CALL_SECONDS: float = float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "5"))
+        self.CIRCUIT_OPEN_SECONDS: float = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+        self.FACEIT_CACHE_PLAYER_TTL: float = float(os.getenv("FACEIT_CACHE_PLAYER_TTL", "3600"))
+        self.FACEIT_CACHE_STATS_TTL: float = float(os.getenv("FACEIT_CACHE_STATS_TTL", "60"))
+        self.FACEIT_CACHE_RANKING_TTL: float = float(os.getenv("FACEIT_CACHE_RANKING_TTL", "300"))
+        self.FACEIT_CACHE_STALE_TTL: float = float(os.getenv("FACEIT_CACHE_STALE_TTL", "600"))
+        self.FACEIT_CACHE_MAX_ENTRIES: int = int(os.getenv("FACEIT_CACHE_MAX_ENTRIES", "5000"))
+        self.TIMER_RESYNC_SECONDS: int = int(os.getenv("TIMER_RESYNC_SECONDS", "600"))
+        self.TIMER_MAX_CONCURRENCY: int = int(os.getenv("TIMER_MAX_CONCURRENCY", "4"))
+        self.TIMER_SPREAD_SECONDS: float = float(os.getenv("TIMER_SPREAD_SECONDS", "60"))
+        self.TOKEN_CACHE_TTL: float = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+        self.TOKEN_CACHE_MAX_ENTRIES: int = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+        self.CONNECTED_SERVICES_CACHE_TTL: float = float(os.getenv("CONNECTED_SERVICES_CACHE_TTL", "30"))
+        self.TOKEN_REFRESH_INTERVAL: int = int(os.getenv("TOKEN_REFRESH_INTERVAL", "60"))
+        self.TOKEN_REFRESH_LEAD_SECONDS: int = int(os.getenv("TOKEN_REFRESH_LEAD_SECONDS", "600"))
+        self.TOKEN_REFRESH_BATCH_SIZE: int = int(os.getenv("TOKEN_REFRESH_BATCH_SIZE", "50"))
+        self.TOKEN_REFRESH_CONCURRENCY: int = int(os.getenv("TOKEN_REFRESH_CONCURRENCY", "5"))
+        self.TWITCH_RECONCILE_INTERVAL: int = int(os.getenv("TWITCH_RECONCILE_INTERVAL", "3600"))
         self.MEDIA_ROOT: str = os.getenv("MEDIA_ROOT", str(base_dir / "uploads"))
         media_url_default = os.getenv("MEDIA_URL", "/uploads")
         self.MEDIA_URL: str = media_url_default if media_url_default.startswith("/") else f"/{media_url_default}"
@@ -42,4 +94,8 @@ class Settings:
     def DATABASE_URL(self) -> str:
         return f"mysql+pymysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        return f"mysql+aiomysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+
 settings = Settings()
@@ -3,7 +3,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi.staticfiles import StaticFiles
-from app.database import engine, Base
+from app.database import engine, Base, SessionLocal
 from app.routers.auth import auth_router
 from app.routers.oauth import oauth_router
 from app.routers.actions import actions_router
@@ -14,6 +14,13 @@ from app.routers.admin import admin_router
 from app.routers.feed import feed_router
 from app.config import settings
 from app.services.timer_scheduler import scheduler as timer_scheduler
+from app.services.trigger_index import trigger_index
+from app.services.event_ingestion import event_workers
+from app.services.event_queue import event_queue
+from app.services.run_history import run_history
+from app.services.http_clients import http_clients
+from app.services.twitch_subscriptions import twitch_reconciler
+from app.services.token_refresher import token_refresher
 
 app = FastAPI()
 
@@ -52,12 +59,30 @@ app.include_router(feed_router)
 
 @app.on_event("startup")
 async def start_background_services():
+    db = SessionLocal()
+    try:
+        trigger_index.rebuild(db)
+    finally:
+        db.close()
+    run_history.start()
     timer_scheduler.start()
+    token_refresher.start()
+    twitch_reconciler.start()
+    if settings.EVENT_INGESTION_MODE == "async":
+        event_workers.start()
+    elif settings.EVENT_INGESTION_MODE == "durable":
+        event_queue.start()
 
 
 @app.on_event("shutdown")
 async def stop_background_services():
+    await event_workers.shutdown()
+    await event_queue.shutdown()
     await timer_scheduler.shutdown()
+    await token_refresher.shutdown()
+    await twitch_reconciler.shutdown()
+    await run_history.shutdown()
+    await http_clients.aclose()
 
 
 @app.get("/")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, Enum, ForeignKey, JSON, DateTime, BigInteger, Integer, VARBINARY, Boolean
+from sqlalchemy import Column, String, Text, Enum, ForeignKey, JSON, DateTime, BigInteger, Integer, VARBINARY, Boolean, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -51,10 +51,16 @@ class WorkflowStep(Base):
     service = Column(String(100), nullable=False)
     event = Column(String(100), nullable=False)
     params = Column(JSON, nullable=True)
+    trigger_key = Column(String(255), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     workflow = relationship("Workflow", back_populates="steps")
 
+    __table_args__ = (
+        Index("idx_steps_routing", "type", "service", "event", "trigger_key"),
+        Index("idx_steps_workflow_order", "workflow_id", "step_order"),
+    )
+
 
 class UserFavoriteWorkflow(Base):
     __tablename__ = "user_favorite_workflows"
@@ -93,3 +99,95 @@ class UserService(Base):
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     user = relationship("User", back_populates="services")
+
+    __table_args__ = (
+        Index("idx_us_token_expires", "token_expires_at"),
+    )
+
+
+class WorkflowEvent(Base):
+    __tablename__ = "workflow_events"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    service = Column(String(100), nullable=False)
+    event_type = Column(String(100), nullable=True)
+    payload = Column(JSON, nullable=False)
+    status = Column(Enum("pending", "processing", "done", "dead", name="workflow_event_status"), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    workflow_ids = Column(JSON, nullable=True)
+    completed_steps = Column(JSON, nullable=True)
+    available_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("idx_events_claim", "status", "available_at"),
+    )
+
+
+class WorkflowRun(Base):
+    __tablename__ = "workflow_runs"
+
+    id = Column(String(32), primary_key=True)
+    workflow_id = Column(BigInteger, nullable=False)
+    user_id = Column(BigInteger, nullable=False)
+    service = Column(String(100), nullable=False)
+    event_type = Column(String(100), nullable=True)
+    status = Column(Enum("success", "failed", name="workflow_run_status"), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    duration_ms = Column(Integer, nullable=False, default=0)
+
+    step_runs = relationship("WorkflowStepRun", back_populates="run", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index("idx_runs_workflow_started", "workflow_id", "started_at"),
+        Index("idx_runs_user_started", "user_id", "started_at"),
+    )
+
+
+class WorkflowStepRun(Base):
+    __tablename__ = "workflow_step_runs"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    run_id = Column(String(32), ForeignKey("workflow_runs.id", ondelete="CASCADE"), nullable=False)
+    step_order = Column(Integer, nullable=False)
+    type = Column(Enum("action", "reaction", "transformation", name="step_types"), nullable=False)
+    service = Column(String(100), nullable=False)
+    event = Column(String(100), nullable=False)
+    status = Column(Enum("success", "failed", name="workflow_run_status"), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    duration_ms = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    output = Column(Text, nullable=True)
+
+    run = relationship("WorkflowRun", back_populates="step_runs")
+
+    __table_args__ = (
+        Index("idx_step_runs_run", "run_id", "step_order"),
+    )
+
+
+class ProcessedEvent(Base):
+    __tablename__ = "processed_events"
+
+    event_key = Column(String(191), primary_key=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class TwitchSubscription(Base):
+    __tablename__ = "twitch_subscriptions"
+
+    id = Column(String(64), primary_key=True)
+    type = Column(String(100), nullable=False)
+    broadcaster_id = Column(String(64), nullable=False)
+    callback = Column(String(255), nullable=False)
+    status = Column(String(64), nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("type", "broadcaster_id", "callback", name="uq_twitch_subscription"),
+    )
@@ -1,31 +1,64 @@
 from fastapi import APIRouter, Request, Header, Depends, Response
 from fastapi.responses import JSONResponse
 from app.services.workflows import trigger_workflows
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.config import settings
 import hmac
 import hashlib
 import json
+from typing import Awaitable, Callable
 from app.services.twitch import parse_twitch_event
+from app.services.event_ingestion import event_workers
+from app.services.event_queue import enqueue_event
+from app.services.event_dedupe import event_dedupe
 
 actions_router = APIRouter(prefix="/actions", tags=["actions"])
 
+async def accept_event(service: str, event_type: str, data: dict, db: AsyncSession) -> JSONResponse:
+    if settings.EVENT_INGESTION_MODE == "durable":
+        await enqueue_event(db, service, event_type, data)
+    elif not event_workers.submit(service, event_type, data):
+        return JSONResponse(status_code=503, content={"detail": "Event queue unavailable"})
+    return JSONResponse(status_code=202, content={"detail": "Event queued"})
+
+async def handle_once(dedupe_key: str | None, db: AsyncSession, handle: Callable[[], Awaitable[Response]]) -> Response:
+    """Run `handle` for an event claimed under `dedupe_key`; release the claim unless the event was accepted."""
+    try:
+        response = await handle()
+    except Exception:
+        if dedupe_key:
+            await event_dedupe.forget(dedupe_key, db)
+        raise
+    if dedupe_key and response.status_code >= 300:
+        await event_dedupe.forget(dedupe_key, db)
+    return response
+
 @actions_router.post("/discord")
-async def discord_action(request: Request, db: Session = Depends(get_db), bot_token: str = Header(None)):
+async def discord_action(request: Request, db: AsyncSession = Depends(get_async_db), bot_token: str = Header(None)):
     if bot_token != settings.BOT_SECRET:
         return JSONResponse(status_code=403, content={"detail": "Forbidden"})
 
     data = await request.json()
     event_type = data.get("event")
 
-    results = await trigger_workflows("discord", event_type, data, db)
-    return JSONResponse(status_code=200, content={"detail": "Workflows triggered", "results": results})
+    event_id = data.get("event_id")
+    dedupe_key = f"discord:{event_id}" if event_id else None
+    if dedupe_key and await event_dedupe.is_duplicate(dedupe_key, db):
+        return JSONResponse(status_code=200, content={"detail": "Duplicate event ignored"})
+
+    async def handle():
+        if settings.EVENT_INGESTION_MODE in ("async", "durable"):
+            return await accept_event("discord", event_type, data, db)
+        results = await trigger_workflows("discord", event_type, data, db)
+        return JSONResponse(status_code=200, content={"detail": "Workflows triggered", "results": results})
+
+    return await handle_once(dedupe_key, db, handle)
 
 @actions_router.post("/twitch")
 async def twitch_webhook(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     twitch_eventsub_message_type: str = Header(None, alias="Twitch-Eventsub-Message-Type"),
     twitch_eventsub_message_signature: str = Header(None, alias="Twitch-Eventsub-Message-Signature"),
     twitch_eventsub_message_id: str = Header(None, alias="Twitch-Eventsub-Message-Id"),
@@ -51,14 +84,25 @@ async def twitch_webhook(
         return Response(content=data["challenge"], media_type="text/plain")
 
     if twitch_eventsub_message_type == "notification":
+        dedupe_key = f"twitch:{twitch_eventsub_message_id}" if twitch_eventsub_message_id else None
+        if dedupe_key and await event_dedupe.is_duplicate(dedupe_key, db):
+            return JSONResponse({"status": "duplicate"})
+
         event_type = data.get("subscription", {}).get("type")
         event_data = data.get("event", {})
 
         payload = parse_twitch_event(event_type, event_data)
         print(f"Parsed payload: {payload}")
         if payload:
-            results = await trigger_workflows("twitch", payload["event"], payload, db)
-            print(f"Workflow results: {results}")
-            return JSONResponse({"status": "processed", "results": results})
+            payload["event_id"] = twitch_eventsub_message_id
+
+            async def handle():
+                if settings.EVENT_INGESTION_MODE in ("async", "durable"):
+                    return await accept_event("twitch", payload["event"], payload, db)
+                results = await trigger_workflows("twitch", payload["event"], payload, db)
+                print(f"Workflow results: {results}")
+                return JSONResponse({"status": "processed", "results": results})
+
+            return await handle_once(dedupe_key, db, handle)
 
     return JSONResponse({"status": "ok"})
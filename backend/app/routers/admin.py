@@ -5,16 +5,19 @@ from app.database import get_db
 from app.services.auth import get_current_admin_user, hash_password
 from app.schemas.admin import UserCreate, UserUpdate
 from app.schemas.auth import UserInfo
+from app.services.workflows import evict_workflow_caches
+from app.services.circuit_breakers import provider_guards
+from app.services.token_storage import invalidate_user_services
 from sqlalchemy import func, text
 
 admin_router = APIRouter(prefix="/admin", tags=["admin"])
 
 @admin_router.get("/users", response_model=list[UserInfo])
-async def get_users(db: Session = Depends(get_db), admin_user: User = Depends(get_current_admin_user)):
+def get_users(db: Session = Depends(get_db), admin_user: User = Depends(get_current_admin_user)):
     return db.query(User).all()
 
 @admin_router.post("/users", response_model=UserInfo)
-async def create_user(user: UserCreate, db: Session = Depends(get_db), admin_user: User = Depends(get_current_admin_user)):
+def create_user(user: UserCreate, db: Session = Depends(get_db), admin_user: User = Depends(get_current_admin_user)):
     db_user = User(
         username=user.username,
         email=user.email,
@@ -32,12 +35,16 @@ async def delete_user(user_id: int, db: Session = Depends(get_db), admin_user: U
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    workflow_ids = [workflow.id for workflow in user.workflows]
     db.delete(user)
     db.commit()
+    for workflow_id in workflow_ids:
+        evict_workflow_caches(workflow_id)
+    invalidate_user_services(user_id)
     return {"detail": "User deleted"}
 
 @admin_router.patch("/users/{user_id}", response_model=UserInfo)
-async def patch_user(user_id: int, updated_user: UserUpdate, db: Session = Depends(get_db), admin_user: User = Depends(get_current_admin_user)):
+def patch_user(user_id: int, updated_user: UserUpdate, db: Session = Depends(get_db), admin_user: User = Depends(get_current_admin_user)):
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -54,7 +61,7 @@ async def patch_user(user_id: int, updated_user: UserUpdate, db: Session = Depen
     return user
 
 @admin_router.get("/stats")
-async def get_stats(db: Session = Depends(get_db), admin_user: User = Depends(get_current_admin_user)):
+def get_stats(db: Session = Depends(get_db), admin_user: User = Depends(get_current_admin_user)):
     user_count = db.query(User).count()
     workflow_count = db.query(Workflow).filter(Workflow.active == True).count()
     services_count = db.query(UserService).count()
@@ -66,4 +73,8 @@ async def get_stats(db: Session = Depends(get_db), admin_user: User = Depends(ge
         "active_workflows": workflow_count,
         "services_connected": services_count,
         "recent_signups": signups_last_7d
-    }
\ No newline at end of file
+    }
+
+@admin_router.get("/providers")
+async def get_provider_health(admin_user: User = Depends(get_current_admin_user)):
+    return provider_guards.snapshot()
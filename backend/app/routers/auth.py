@@ -3,12 +3,15 @@ from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from uuid import uuid4
 
+from anyio import from_thread
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from sqlalchemy.orm import Session
 
 from app.services.auth import get_user_by_email, hash_password, create_jwt_token, verify_password, send_verification_email, get_current_user
 from app.database import get_db
 from app.models.models import User
+from app.services.workflows import evict_workflow_caches
+from app.services.token_storage import invalidate_user_services
 from app.schemas.auth import UserCreate, Token, VerificationResponse, UserInfo, UserLogin, ResendVerificationRequest, ChangePasswordRequest
 from app.config import settings
 
@@ -99,10 +102,19 @@ def resend_verification(request: ResendVerificationRequest, db: Session = Depend
 def get_my_info(current_user: User = Depends(get_current_user)):
     return current_user
 
+def forget_user_caches(user_id: int, workflow_ids: list[int]):
+    for workflow_id in workflow_ids:
+        evict_workflow_caches(workflow_id)
+    invalidate_user_services(user_id)
+
 @auth_router.delete("/me")
 def delete_my_account(db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+    user_id = current_user.id
+    workflow_ids = [workflow.id for workflow in current_user.workflows]
     db.delete(current_user)
     db.commit()
+    # This route runs in a worker thread; the caches are only changed from the event loop.
+    from_thread.run_sync(forget_user_caches, user_id, workflow_ids)
     return {"detail": "Account deleted"}
 
 MAX_PROFILE_IMAGE_SIZE = 5 * 1024 * 1024
@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.services.auth import get_current_user
-from app.services.token_storage import get_token_from_db
+from app.services.token_storage import get_connected_services
 
 catalog_router = APIRouter(prefix="/catalog", tags=["catalog"])
 
@@ -576,17 +576,17 @@ REACTIONS_CATALOG = {
 }
 
 @catalog_router.get("/actions")
-async def get_actions(db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+async def get_actions(db: AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user)):
+    linked = await get_connected_services(db, current_user.id)
     out = {}
     for key, meta in ACTIONS_CATALOG.items():
-        token = get_token_from_db(db, current_user.id, meta["service"])
-        out[key] = {**meta, "available": bool(token)}
+        out[key] = {**meta, "available": meta["service"] in linked}
     return JSONResponse(out)
 
 @catalog_router.get("/reactions")
-async def get_reactions(db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+async def get_reactions(db: AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user)):
+    linked = await get_connected_services(db, current_user.id)
     out = {}
     for key, meta in REACTIONS_CATALOG.items():
-        token = get_token_from_db(db, current_user.id, meta["service"])
-        out[key] = {**meta, "available": bool(token)}
+        out[key] = {**meta, "available": meta["service"] in linked}
     return JSONResponse(out)
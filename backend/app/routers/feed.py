@@ -1,28 +1,30 @@
 from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from app.models.models import Workflow, WorkflowStep, User
-from app.database import get_db
+from app.database import get_async_db
 
 feed_router = APIRouter(prefix="/feed", tags=["feed"])
 
 @feed_router.get("/workflows")
 async def get_public_workflows(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     skip: int = Query(0, ge=0),
     limit: int = Query(20, le=100),
     service: str = Query(None, description="Filtrer par service (ex: discord, twitch, etc.)"),
 ):
-    query = db.query(Workflow).filter(
+    query = select(Workflow).where(
         Workflow.visibility == "public"
-    )
+    ).options(selectinload(Workflow.steps), selectinload(Workflow.user))
     if service:
-        query = query.join(Workflow.steps).filter(WorkflowStep.service == service)
-    workflows = (
+        query = query.where(Workflow.steps.any(WorkflowStep.service == service))
+    result = await db.execute(
         query.order_by(Workflow.created_at.desc())
         .offset(skip)
         .limit(limit)
-        .all()
     )
+    workflows = result.scalars().all()
     return [
         {
             "id": w.id,
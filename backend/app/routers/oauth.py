@@ -2,11 +2,13 @@ from typing import Dict, Any
 from fastapi import APIRouter, Request, Depends, Query
 from fastapi.responses import RedirectResponse, JSONResponse
 from authlib.integrations.starlette_client import OAuth
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.config import settings
-from app.database import get_db
+from app.database import get_async_db
 from app.models.models import UserService
-from app.services.token_storage import save_token_to_db, get_token_from_db
+from app.services.token_storage import save_token_to_db_async, get_token_from_db_async, get_connected_services, invalidate_user_services
+from app.services.http_clients import http_clients
 from app.services.auth import get_current_user, hash_password, create_jwt_token, random_password
 from jose import JWTError, jwt
 from app.models.models import User
@@ -23,6 +25,7 @@ oauth.register(
     authorize_url="https://accounts.spotify.com/authorize",
     api_base_url="https://api.spotify.com/v1/",
     client_kwargs={
+        "transport": http_clients.transport("spotify"),
         "scope": 'user-read-private user-read-email user-modify-playback-state user-read-playback-state',
     },
 )
@@ -36,6 +39,7 @@ oauth.register(
     authorize_url="https://x.com/i/oauth2/authorize",
     api_base_url="https://api.x.com/2/",
     client_kwargs={
+        "transport": http_clients.transport("twitter"),
         "scope": "tweet.read users.read offline.access tweet.write",
         "code_challenge_method": "S256",
     },
@@ -49,6 +53,7 @@ oauth.register(
     authorize_url="https://discord.com/api/oauth2/authorize",
     api_base_url="https://discord.com/api/",
     client_kwargs={
+        "transport": http_clients.transport("discord"),
         "scope": "identify email guilds",
     },
 )
@@ -61,6 +66,7 @@ oauth.register(
     access_token_url="https://api.faceit.com/auth/v1/oauth/token",
     api_base_url="https://open.faceit.com/data/v4/",
     client_kwargs={
+        "transport": http_clients.transport("faceit"),
         "scope": "email profile membership",
         "code_challenge_method": "S256",
     },
@@ -73,6 +79,7 @@ oauth.register(
     server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
     api_base_url="https://www.googleapis.com/",
     client_kwargs={
+        "transport": http_clients.transport("google"),
         "scope": (
             "openid email profile "
             "https://www.googleapis.com/auth/gmail.readonly "
@@ -92,6 +99,7 @@ oauth.register(
     authorize_url="https://id.twitch.tv/oauth2/authorize",
     api_base_url="https://api.twitch.tv/helix/",
     client_kwargs={
+        "transport": http_clients.transport("twitch"),
         "scope": "user:read:email channel:read:subscriptions moderator:read:followers user:read:follows",
         "token_endpoint_auth_method": "client_secret_post"
     }
@@ -103,7 +111,7 @@ async def oauth_login(
     request: Request,
     token: str = Query(None),
     redirect_uri_param: str | None = Query(None, alias="redirect_uri"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     if provider not in oauth._clients:
         return JSONResponse({"error": "Unknown provider"}, status_code=400)
@@ -116,7 +124,7 @@ async def oauth_login(
             email: str = payload.get("sub")
             if not email:
                 return JSONResponse({"error": "Invalid token"}, status_code=401)
-            user = db.query(User).filter(User.email == email).first()
+            user = (await db.execute(select(User).where(User.email == email))).scalars().first()
             if not user:
                 return JSONResponse({"error": "User not found"}, status_code=404)
             request.session['oauth_user_id'] = user.id
@@ -136,7 +144,7 @@ async def oauth_login(
     return await oauth.create_client(provider).authorize_redirect(request, redirect_uri, redirect_popup="true")
 
 @oauth_router.get("/{provider}/callback")
-async def oauth_callback(provider: str, request: Request, db: Session = Depends(get_db)):
+async def oauth_callback(provider: str, request: Request, db: AsyncSession = Depends(get_async_db)):
     if provider not in oauth._clients:
         return JSONResponse({"error": "Unknown provider"}, status_code=400)
 
@@ -153,7 +161,7 @@ async def oauth_callback(provider: str, request: Request, db: Session = Depends(
             if not user_id:
                 return JSONResponse({"error": "User not found for link"}, status_code=400)
 
-            save_token_to_db(db, user_id, provider, token)
+            await save_token_to_db_async(db, user_id, provider, token)
 
             request.session.pop('oauth_context', None)
             request.session.pop('oauth_user_id', None)
@@ -172,7 +180,7 @@ async def oauth_callback(provider: str, request: Request, db: Session = Depends(
         if not email:
             return JSONResponse({"error": "Unable to retrieve email from provider"}, status_code=400)
 
-        user = db.query(User).filter(User.email == email).first()
+        user = (await db.execute(select(User).where(User.email == email))).scalars().first()
 
         if not user:
             user = User(
@@ -183,10 +191,10 @@ async def oauth_callback(provider: str, request: Request, db: Session = Depends(
                 is_verified=True
             )
             db.add(user)
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            await db.refresh(user)
 
-        save_token_to_db(db, user.id, provider, token)
+        await save_token_to_db_async(db, user.id, provider, token)
 
         access_token = create_jwt_token({"sub": user.email})
 
@@ -206,29 +214,31 @@ async def oauth_callback(provider: str, request: Request, db: Session = Depends(
         }, status_code=500)
 
 @oauth_router.get("/{provider}/status")
-async def oauth_status(provider: str, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+async def oauth_status(provider: str, db: AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user)):
     if provider == "timer":
         return JSONResponse({"logged_in": True})
-    token = get_token_from_db(db, current_user.id, provider)
+    token = await get_token_from_db_async(db, current_user.id, provider)
     if not token:
         return JSONResponse({"logged_in": False})
     return JSONResponse({"logged_in": True, "has_token": True})
 
 @oauth_router.delete("/{provider}/disconnect")
-async def oauth_disconnect(provider: str, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
-    service = db.query(UserService).filter(
+async def oauth_disconnect(provider: str, db: AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user)):
+    result = await db.execute(select(UserService).where(
         UserService.user_id == current_user.id,
         UserService.service_key == provider
-    ).first()
+    ))
+    service = result.scalars().first()
     if service:
-        db.delete(service)
-        db.commit()
+        await db.delete(service)
+        await db.commit()
+        invalidate_user_services(current_user.id, provider)
         return {"msg": f"Service {provider} disconnected successfully"}
     return JSONResponse({"error": "Service not found"}, status_code=404)
 
 @oauth_router.get("/{provider}/token")
-async def get_oauth_token(provider: str, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
-    token = get_token_from_db(db, current_user.id, provider)
+async def get_oauth_token(provider: str, db: AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user)):
+    token = await get_token_from_db_async(db, current_user.id, provider)
     if not token:
         return JSONResponse({"error": "Token not found"}, status_code=404)
     return JSONResponse({"token": token})
@@ -265,14 +275,11 @@ SERVICES_INFO = {
 }
 
 @oauth_router.get("/services")
-async def get_services(db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+async def get_services(db: AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user)):
+    linked = await get_connected_services(db, current_user.id)
     services = []
     for provider, info in SERVICES_INFO.items():
-        if provider == "timer":
-            connected = True
-        else:
-            token = get_token_from_db(db, current_user.id, provider)
-            connected = bool(token)
+        connected = provider == "timer" or provider in linked
         services.append({
             "provider": provider,
             "name": info["name"],
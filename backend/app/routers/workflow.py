@@ -1,23 +1,37 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from app.database import get_async_db, get_db
 from app.models.models import Workflow, WorkflowStep, User
 from app.schemas.workflows import WorkflowCreate, WorkflowStepCreate, WorkflowOut
 from app.services.auth import get_current_user
-from app.services.twitch import delete_twitch_webhook
 from app.services.reactions import execute_reaction
 from app.services.actions import execute_action
-from app.services.workflows import create_steps_for_workflow, delete_steps_for_workflow
+from app.services.workflows import build_steps_for_workflow, create_steps_for_workflow, delete_steps_for_workflow, refresh_workflow_caches, evict_workflow_caches, release_twitch_subscriptions, twitch_webhook_ids
 
 workflows_router = APIRouter(prefix="/workflows", tags=["workflows"])
 
+async def get_user_workflow(db: AsyncSession, workflow_id: int, user_id: int, *options) -> Workflow | None:
+    """The user's workflow with its steps (and `options`) loaded, re-read even if the session already holds it."""
+    result = await db.execute(
+        select(Workflow)
+        .options(selectinload(Workflow.steps), *options)
+        .where(Workflow.id == workflow_id, Workflow.user_id == user_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
 @workflows_router.post("/", response_model=WorkflowOut)
 async def create_workflow(
     workflow: WorkflowCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     try:
+        # Reject an invalid plan before the workflow row exists.
+        pending_steps = build_steps_for_workflow(None, workflow.steps)
+
         db_workflow = Workflow(
             user_id=current_user.id,
             name=workflow.name,
@@ -26,15 +40,20 @@ async def create_workflow(
             active=workflow.active
         )
         db.add(db_workflow)
-        db.commit()
-        db.refresh(db_workflow)
+        await db.commit()
 
-        await create_steps_for_workflow(db, db_workflow.id, workflow.steps, current_user.id)
+        for db_step in pending_steps:
+            db_step.workflow_id = db_workflow.id
+        await create_steps_for_workflow(db, db_workflow.id, workflow.steps, current_user.id, pending_steps)
 
-        db.commit()
+        db_workflow = await get_user_workflow(db, db_workflow.id, current_user.id)
+        refresh_workflow_caches(db_workflow)
         return db_workflow
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to create workflow: {e}")
 
 @workflows_router.get("/", response_model=list[WorkflowOut])
@@ -47,30 +66,25 @@ def list_workflows(
 @workflows_router.delete("/{workflow_id}", status_code=204)
 async def delete_workflow(
     workflow_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    workflow = db.query(Workflow).filter_by(id=workflow_id, user_id=current_user.id).first()
+    # Deleting cascades to favorites, which an AsyncSession cannot lazy load.
+    workflow = await get_user_workflow(db, workflow_id, current_user.id, selectinload(Workflow.favorites))
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
 
-    for step in workflow.steps:
-        if step.type == "action" and step.service == "twitch":
-            webhook_id = step.params.get("webhook_id") if step.params else None
-            if webhook_id:
-                try:
-                    await delete_twitch_webhook(db, current_user.id, webhook_id)
-                except Exception as e:
-                    print(f"Failed to delete Twitch webhook {webhook_id}: {e}")
-
-    db.delete(workflow)
-    db.commit()
+    webhook_ids = twitch_webhook_ids(workflow.steps)
+    await db.delete(workflow)
+    await db.commit()
+    evict_workflow_caches(workflow_id)
+    await release_twitch_subscriptions(webhook_ids)
     return
 
 @workflows_router.post("/test-step")
 async def test_workflow_step(
     step: WorkflowStepCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     params = step.params or {}
@@ -110,47 +124,52 @@ async def test_workflow_step(
 async def update_workflow(
     workflow_id: int,
     workflow_update: WorkflowCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    db_workflow = db.query(Workflow).filter_by(id=workflow_id, user_id=current_user.id).first()
+    db_workflow = await get_user_workflow(db, workflow_id, current_user.id)
     if not db_workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
 
+    released: list[str] = []
     try:
         db_workflow.name = workflow_update.name
         db_workflow.description = workflow_update.description
         db_workflow.visibility = workflow_update.visibility
         db_workflow.active = workflow_update.active
+        db_workflow.updated_at = func.now()
 
-        await delete_steps_for_workflow(db, db_workflow, current_user.id)
-        await create_steps_for_workflow(db, db_workflow.id, workflow_update.steps, current_user.id)
-        db.commit()
-        db.refresh(db_workflow)
+        pending_steps = build_steps_for_workflow(db_workflow.id, workflow_update.steps)
+        released = await delete_steps_for_workflow(db, db_workflow)
+        await create_steps_for_workflow(db, db_workflow.id, workflow_update.steps, current_user.id, pending_steps)
+        db_workflow = await get_user_workflow(db, workflow_id, current_user.id)
+        refresh_workflow_caches(db_workflow)
 
         return db_workflow
 
     except HTTPException:
-        db.rollback()
+        await db.rollback()
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Failed to update workflow: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to update workflow: {e}")
+    finally:
+        await release_twitch_subscriptions(released)
 
 @workflows_router.patch("/{workflow_id}/toggle", response_model=WorkflowOut)
 async def toggle_workflow_status(
     workflow_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Toggle the active status of a workflow"""
-    workflow = db.query(Workflow).filter_by(id=workflow_id, user_id=current_user.id).first()
+    workflow = await get_user_workflow(db, workflow_id, current_user.id)
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
 
     workflow.active = not workflow.active
-    db.commit()
-    db.refresh(workflow)
+    await db.commit()
+    refresh_workflow_caches(workflow)
 
     return workflow
@@ -1,12 +1,19 @@
+import asyncio
 import html
 from typing import Dict, Any, Callable, Awaitable
 from sqlalchemy.orm import Session
-import httpx
+from app.services.http_clients import http_clients
+from app.services.circuit_breakers import provider_guards
+from app.services.response_cache import AsyncTTLCache
 from app.config import settings
-from app.services.token_storage import refresh_oauth_token
+from app.services.token_storage import refresh_oauth_token, uses_token
 from app.routers.oauth import oauth
 from app.services.timer_utils import parse_interval_minutes
 
+# Gmail metadata lookups in flight per call; matches the 20-message cap so a call takes two round trips.
+GMAIL_METADATA_CONCURRENCY = 20
+
+@uses_token("discord")
 async def discord_list_guilds_action(db: Session, user_id: int, params: dict) -> dict[str, Any]:
     token = await refresh_oauth_token(db, user_id, "discord")
     if not token:
@@ -14,12 +21,12 @@ async def discord_list_guilds_action(db: Session, user_id: int, params: dict) ->
     access_token = token.get("access_token")
     if not access_token:
         raise ValueError("Discord token missing access_token")
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            "https://discord.com/api/users/@me/guilds",
-            headers={"Authorization": f"Bearer {access_token}"},
-            timeout=10.0,
-        )
+    client = http_clients.get("discord")
+    response = await client.get(
+        "https://discord.com/api/users/@me/guilds",
+        headers={"Authorization": f"Bearer {access_token}"},
+        timeout=10.0,
+    )
     if response.status_code != 200:
         raise ValueError(f"Failed to fetch guilds: {response.text}")
     guilds = response.json()
@@ -33,6 +40,7 @@ async def discord_list_guilds_action(db: Session, user_id: int, params: dict) ->
     return {"text": "\n".join(lines)}
 
 
+@uses_token("google")
 async def google_recent_emails_action(db: Session, user_id: int, params: dict) -> dict[str, Any]:
     sender = params.get("sender")
     if not sender or not str(sender).strip():
@@ -66,26 +74,25 @@ async def google_recent_emails_action(db: Session, user_id: int, params: dict) -
             detail = list_response.text
         raise ValueError(f"Failed to fetch emails: {detail}")
     messages_meta = list_response.json().get("messages", [])
-    results: list[dict[str, Any]] = []
-    for meta in messages_meta:
-        message_id = meta.get("id")
-        if not message_id:
-            continue
-        message_response = await client.get(
-            f"gmail/v1/users/me/messages/{message_id}",
-            params={
-                "format": "metadata",
-                "metadataHeaders": ["Subject", "Date", "From", "To"]
-            },
-            token=token
-        )
+    semaphore = asyncio.Semaphore(GMAIL_METADATA_CONCURRENCY)
+
+    async def fetch_message(message_id: str) -> dict[str, Any] | None:
+        async with semaphore:
+            message_response = await client.get(
+                f"gmail/v1/users/me/messages/{message_id}",
+                params={
+                    "format": "metadata",
+                    "metadataHeaders": ["Subject", "Date", "From", "To"]
+                },
+                token=token
+            )
         if message_response.status_code != 200:
-            continue
+            return None
         data = message_response.json()
         headers = {h["name"]: h["value"] for h in data.get("payload", {}).get("headers", [])}
         raw_snippet = data.get("snippet")
         snippet = html.unescape(raw_snippet) if raw_snippet else ""
-        results.append({
+        return {
             "id": message_id,
             "threadId": data.get("threadId"),
             "subject": headers.get("Subject"),
@@ -93,7 +100,12 @@ async def google_recent_emails_action(db: Session, user_id: int, params: dict) -
             "from": headers.get("From"),
             "to": headers.get("To"),
             "snippet": snippet,
-        })
+        }
+
+    fetched = await asyncio.gather(*(
+        fetch_message(meta["id"]) for meta in messages_meta if meta.get("id")
+    ))
+    results: list[dict[str, Any]] = [message for message in fetched if message is not None]
     if not results:
         return {"text": "No emails found."}
     lines = []
@@ -108,6 +120,58 @@ async def google_recent_emails_action(db: Session, user_id: int, params: dict) -
     return {"data": "\n".join(lines)}
 
 
+class FaceitRequestError(ValueError):
+    def __init__(self, detail: Any):
+        super().__init__(str(detail))
+        self.detail = detail
+
+
+faceit_players_cache = AsyncTTLCache("faceit_players", settings.FACEIT_CACHE_PLAYER_TTL, settings.FACEIT_CACHE_STALE_TTL, settings.FACEIT_CACHE_MAX_ENTRIES)
+faceit_stats_cache = AsyncTTLCache("faceit_stats", settings.FACEIT_CACHE_STATS_TTL, settings.FACEIT_CACHE_STALE_TTL, settings.FACEIT_CACHE_MAX_ENTRIES)
+faceit_rankings_cache = AsyncTTLCache("faceit_rankings", settings.FACEIT_CACHE_RANKING_TTL, settings.FACEIT_CACHE_STALE_TTL, settings.FACEIT_CACHE_MAX_ENTRIES)
+
+
+async def faceit_get(url: str, params: dict | None = None) -> Any:
+    client = http_clients.get("faceit")
+    response = await client.get(
+        url,
+        params=params,
+        headers={
+            "Authorization": f"Bearer {settings.FACEIT_API_KEY}",
+            "Accept": "application/json",
+        },
+        timeout=10.0,
+    )
+    if response.status_code != 200:
+        try:
+            detail = response.json()
+        except Exception:
+            detail = response.text
+        raise FaceitRequestError(detail)
+    return response.json()
+
+
+async def fetch_faceit_player(nickname: str) -> Any:
+    return await faceit_players_cache.get(
+        nickname,
+        lambda: faceit_get("https://open.faceit.com/data/v4/players", {"nickname": nickname}),
+    )
+
+
+async def fetch_faceit_stats(player_id: str, game_id: str) -> Any:
+    return await faceit_stats_cache.get(
+        (player_id, game_id),
+        lambda: faceit_get(f"https://open.faceit.com/data/v4/players/{player_id}/games/{game_id}/stats", {"limit": 1}),
+    )
+
+
+async def fetch_faceit_ranking(game_id: str, region: str, player_id: str) -> Any:
+    return await faceit_rankings_cache.get(
+        (game_id, region, player_id),
+        lambda: faceit_get(f"https://open.faceit.com/data/v4/rankings/games/{game_id}/regions/{region}/players/{player_id}"),
+    )
+
+
 async def faceit_player_stats_action(db: Session, user_id: int, params: dict) -> dict[str, Any]:
     api_key = settings.FACEIT_API_KEY
     if not api_key:
@@ -122,26 +186,11 @@ async def faceit_player_stats_action(db: Session, user_id: int, params: dict) ->
     player_id = str(player_id).strip()
     game_id = str(game_id).strip()
 
-    query_params: dict[str, Any] = {"limit": 1}
-
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"https://open.faceit.com/data/v4/players/{player_id}/games/{game_id}/stats",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Accept": "application/json",
-            },
-            params=query_params,
-            timeout=10.0,
-        )
-    if response.status_code != 200:
-        try:
-            detail = response.json()
-        except Exception:
-            detail = response.text
-        raise ValueError(f"Failed to fetch stats: {detail}")
+    try:
+        data = await fetch_faceit_stats(player_id, game_id)
+    except FaceitRequestError as exc:
+        raise ValueError(f"Failed to fetch stats: {exc.detail}")
 
-    data = response.json()
     matches = data.get("items") if isinstance(data, dict) else None
     last_match = None
     if isinstance(matches, list) and matches:
@@ -220,23 +269,11 @@ async def faceit_get_player_id_action(db: Session, user_id: int, params: dict) -
         raise ValueError("Missing nickname")
     nickname = str(nickname).strip()
 
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.get(
-            "https://open.faceit.com/data/v4/players",
-            params={"nickname": nickname},
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Accept": "application/json",
-            },
-        )
-    if response.status_code != 200:
-        try:
-            detail = response.json()
-        except Exception:
-            detail = response.text
-        raise ValueError(f"Failed to fetch player: {detail}")
+    try:
+        data = await fetch_faceit_player(nickname)
+    except FaceitRequestError as exc:
+        raise ValueError(f"Failed to fetch player: {exc.detail}")
 
-    data = response.json()
     player_id = data.get("player_id")
     if not player_id:
         raise ValueError(f"Player '{nickname}' not found")
@@ -275,64 +312,40 @@ async def faceit_player_ranking_action(db: Session, user_id: int, params: dict)
             return None
         return str(value).strip().upper()
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Accept": "application/json",
-    }
+    try:
+        player_data = await fetch_faceit_player(nickname)
+    except FaceitRequestError as exc:
+        raise ValueError(f"Failed to fetch player by nickname: {exc.detail}")
+    if not isinstance(player_data, dict):
+        raise ValueError("Unexpected player payload from FACEIT")
 
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        player_response = await client.get(
-            "https://open.faceit.com/data/v4/players",
-            params={"nickname": nickname},
-            headers=headers,
-        )
-        if player_response.status_code != 200:
-            try:
-                detail = player_response.json()
-            except Exception:
-                detail = player_response.text
-            raise ValueError(f"Failed to fetch player by nickname: {detail}")
-
-        player_data = player_response.json()
-        if not isinstance(player_data, dict):
-            raise ValueError("Unexpected player payload from FACEIT")
-
-        player_id = player_data.get("player_id")
-        if not player_id:
-            raise ValueError(f"Player '{nickname}' not found on FACEIT")
-
-        resolved_nickname = player_data.get("nickname") or nickname
-
-        games_info = player_data.get("games") or {}
-        game_entry = None
-        for candidate in {game_id, game_id.lower(), game_id.upper()}:
-            if isinstance(games_info, dict) and candidate in games_info:
-                game_entry = games_info[candidate]
-                game_id = candidate
-                break
-        if not isinstance(game_entry, dict):
-            game_entry = {}
+    player_id = player_data.get("player_id")
+    if not player_id:
+        raise ValueError(f"Player '{nickname}' not found on FACEIT")
 
-        region = game_entry.get("region") or player_data.get("region")
-        if not region:
-            raise ValueError("Unable to determine the player's region for this game")
-        region = str(region).strip()
+    resolved_nickname = player_data.get("nickname") or nickname
 
-        country_code = _normalize_country(player_data.get("country"))
+    games_info = player_data.get("games") or {}
+    game_entry = None
+    for candidate in {game_id, game_id.lower(), game_id.upper()}:
+        if isinstance(games_info, dict) and candidate in games_info:
+            game_entry = games_info[candidate]
+            game_id = candidate
+            break
+    if not isinstance(game_entry, dict):
+        game_entry = {}
 
-        ranking_response = await client.get(
-            f"https://open.faceit.com/data/v4/rankings/games/{game_id}/regions/{region}/players/{player_id}",
-            headers=headers,
-            timeout=10.0,
-        )
-        if ranking_response.status_code != 200:
-            try:
-                detail = ranking_response.json()
-            except Exception:
-                detail = ranking_response.text
-            raise ValueError(f"Failed to fetch ranking: {detail}")
+    region = game_entry.get("region") or player_data.get("region")
+    if not region:
+        raise ValueError("Unable to determine the player's region for this game")
+    region = str(region).strip()
+
+    country_code = _normalize_country(player_data.get("country"))
 
-        ranking_data = ranking_response.json()
+    try:
+        ranking_data = await fetch_faceit_ranking(game_id, region, player_id)
+    except FaceitRequestError as exc:
+        raise ValueError(f"Failed to fetch ranking: {exc.detail}")
 
     if not isinstance(ranking_data, dict):
         raise ValueError("Unexpected FACEIT ranking payload")
@@ -420,4 +433,4 @@ async def execute_action(service: str, event: str, db: Session, user_id: int, pa
     handler = ACTION_DISPATCH.get((service, event))
     if not handler:
         raise NotImplementedError(f"No action for {service}:{event}")
-    return await handler(db, user_id, params)
+    return await provider_guards.call(service, handler, db, user_id, params)
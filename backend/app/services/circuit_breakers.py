@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Tuple
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Services handled in-process, with no provider to protect.
+LOCAL_SERVICES = {"timer"}
+
+
+class ProviderUnavailableError(RuntimeError):
+    """Raised instead of calling a provider whose circuit is open or whose bulkhead is full."""
+
+
+class CircuitBreaker:
+    """Opens when too many recent calls failed or were slow, then lets one probe through after a cool-down.
+
+    Transport errors, 5xx responses and requests slower than
+    `slow_call_seconds` count as failures; other responses, including 4xx and
+    429, count as successes.
+    """
+
+    def __init__(self, name: str, failure_ratio: float = 0.5, min_calls: int = 10, window_seconds: float = 60.0, slow_call_seconds: float = 5.0, open_seconds: float = 30.0):
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.min_calls = max(1, min_calls)
+        self.window_seconds = window_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.opened_at: float | None = None
+        self._calls: Deque[Tuple[float, bool]] = deque()
+        self._probing = False
+
+    def _trim(self, now: float):
+        while self._calls and self._calls[0][0] < now - self.window_seconds:
+            self._calls.popleft()
+
+    def is_open(self) -> bool:
+        """True while the circuit fails fast; unlike `allow`, never takes the half-open probe."""
+        return self.state == "open" and time.monotonic() - self.opened_at < self.open_seconds
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.open_seconds:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def release_probe(self):
+        """Give the half-open probe back when it never reached the provider."""
+        self._probing = False
+
+    def record(self, failed: bool, duration: float):
+        failed = failed or duration >= self.slow_call_seconds
+        now = time.monotonic()
+        if self.state == "half_open":
+            self._probing = False
+            if failed:
+                self._open(now)
+            else:
+                self.state = "closed"
+                self._calls.clear()
+                logger.info("Circuit for %s closed", self.name)
+            return
+
+        self._calls.append((now, failed))
+        self._trim(now)
+        failures = sum(1 for _, call_failed in self._calls if call_failed)
+        if len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.failure_ratio:
+            self._open(now)
+
+    def _open(self, now: float):
+        self.state = "open"
+        self.opened_at = now
+        self._calls.clear()
+        logger.warning("Circuit for %s opened for %.0fs", self.name, self.open_seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._trim(time.monotonic())
+        failures = sum(1 for _, failed in self._calls if failed)
+        return {
+            "state": self.state,
+            "recent_calls": len(self._calls),
+            "recent_failures": failures,
+            "open_for_seconds": round(time.monotonic() - self.opened_at, 1) if self.state != "closed" else None,
+        }
+
+
+class ProviderGuard:
+    """Circuit breaker plus a concurrency bulkhead for one provider.
+
+    It wraps each HTTP request below the rate limiter (see GuardedTransport),
+    so time spent queued for a rate limit bucket or a Retry-After neither
+    counts as latency nor holds a bulkhead slot.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, queue_timeout: float, breaker: CircuitBreaker):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_timeout = queue_timeout
+        self.breaker = breaker
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._active = 0
+
+    async def send(self, transport: httpx.AsyncBaseTransport, request: httpx.Request) -> httpx.Response:
+        if not self.breaker.allow():
+            raise ProviderUnavailableError(f"{self.name} is unavailable (circuit open)")
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.breaker.release_probe()
+            raise ProviderUnavailableError(f"{self.name} is saturated ({self.max_concurrency} requests in flight)")
+
+        self._active += 1
+        started = time.perf_counter()
+        try:
+            response = await transport.handle_async_request(request)
+        except (httpx.HTTPError, asyncio.TimeoutError):
+            self.breaker.record(True, time.perf_counter() - started)
+            raise
+        except BaseException:
+            self.breaker.release_probe()
+            raise
+        else:
+            self.breaker.record(response.status_code >= 500, time.perf_counter() - started)
+            return response
+        finally:
+            self._active -= 1
+            self._semaphore.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.breaker.snapshot(),
+            "in_flight": self._active,
+            "max_concurrency": self.max_concurrency,
+        }
+
+
+class GuardedTransport(httpx.AsyncBaseTransport):
+    """Sends every request of a provider's pool through its ProviderGuard."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, guard: ProviderGuard):
+        self._transport = transport
+        self.guard = guard
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.guard.send(self._transport, request)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class ProviderGuards:
+    def __init__(self):
+        self._guards: Dict[str, ProviderGuard] = {}
+
+    def get(self, provider: str) -> ProviderGuard:
+        guard = self._guards.get(provider)
+        if guard is None:
+            guard = ProviderGuard(
+                provider,
+                max_concurrency=settings.PROVIDER_MAX_CONCURRENCY,
+                queue_timeout=settings.PROVIDER_QUEUE_TIMEOUT,
+                breaker=CircuitBreaker(
+                    provider,
+                    failure_ratio=settings.CIRCUIT_FAILURE_RATIO,
+                    min_calls=settings.CIRCUIT_MIN_CALLS,
+                    window_seconds=settings.CIRCUIT_WINDOW_SECONDS,
+                    slow_call_seconds=settings.CIRCUIT_SLOW_CALL_SECONDS,
+                    open_seconds=settings.CIRCUIT_OPEN_SECONDS,
+                ),
+            )
+            self._guards[provider] = guard
+        return guard
+
+    async def call(self, provider: str, func: Callable[..., Awaitable[Any]], *args):
+        """Run a handler, failing fast without calling it while the provider's circuit is open."""
+        if provider not in LOCAL_SERVICES and self.get(provider).breaker.is_open():
+            raise ProviderUnavailableError(f"{provider} is unavailable (circuit open)")
+        return await func(*args)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {name: guard.snapshot() for name, guard in sorted(self._guards.items())}
+
+
+provider_guards = ProviderGuards()
@@ -0,0 +1,30 @@
+import asyncio
+from typing import Any, Awaitable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+class KeyedConcurrencyLimiter:
+    """Caps concurrent coroutines globally and per key (e.g. per user)."""
+
+    def __init__(self, limit: int, per_key_limit: int):
+        self.limit = max(1, limit)
+        self.per_key_limit = max(1, per_key_limit)
+        self._global = asyncio.Semaphore(self.limit)
+        self._per_key: Dict[Any, asyncio.Semaphore] = {}
+        self._holders: Dict[Any, int] = {}
+
+    async def run(self, key: Any, coro: Awaitable[T]) -> T:
+        semaphore = self._per_key.get(key)
+        if semaphore is None:
+            semaphore = self._per_key[key] = asyncio.Semaphore(self.per_key_limit)
+        self._holders[key] = self._holders.get(key, 0) + 1
+        try:
+            async with semaphore:
+                async with self._global:
+                    return await coro
+        finally:
+            self._holders[key] -= 1
+            if not self._holders[key]:
+                self._holders.pop(key, None)
+                self._per_key.pop(key, None)
@@ -0,0 +1,107 @@
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.models import ProcessedEvent
+
+logger = logging.getLogger(__name__)
+
+
+class EventDeduplicator:
+    """TTL-bounded record of provider message ids already accepted.
+
+    The in-memory LRU answers most lookups; the `database` backend also records
+    keys in processed_events so several backend processes share the same view.
+    """
+
+    def __init__(self, ttl_seconds: int = 600, max_entries: int = 100000, backend: str = "memory", purge_every: int = 1000):
+        self.ttl_seconds = max(1, ttl_seconds)
+        self.max_entries = max(1, max_entries)
+        self.backend = backend
+        self.purge_every = max(1, purge_every)
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._inserts = 0
+
+    async def is_duplicate(self, key: str, db: AsyncSession | None = None) -> bool:
+        """Return True if `key` was already accepted within the TTL, otherwise record it.
+
+        Callers that then fail to accept the event must `forget` the key, or
+        the provider's redelivery would be dropped as a duplicate.
+        """
+        now = time.monotonic()
+        self._evict_expired(now)
+
+        expires_at = self._seen.get(key)
+        if expires_at is not None and expires_at > now:
+            return True
+
+        if self.backend == "database" and db is not None and await self._seen_in_db(db, key):
+            self._remember(key, now)
+            return True
+
+        self._remember(key, now)
+        return False
+
+    async def forget(self, key: str, db: AsyncSession | None = None):
+        self._seen.pop(key, None)
+        if self.backend != "database" or db is None:
+            return
+        try:
+            # The failed request may have left the session mid-transaction.
+            await db.rollback()
+            await db.execute(delete(ProcessedEvent).where(ProcessedEvent.event_key == key))
+            await db.commit()
+        except Exception as exc:
+            await db.rollback()
+            logger.warning("Failed to release processed event %s: %s", key, exc)
+
+    def _remember(self, key: str, now: float):
+        self._seen[key] = now + self.ttl_seconds
+        self._seen.move_to_end(key)
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+
+    def _evict_expired(self, now: float):
+        while self._seen:
+            key, expires_at = next(iter(self._seen.items()))
+            if expires_at > now:
+                break
+            self._seen.popitem(last=False)
+
+    async def _seen_in_db(self, db: AsyncSession, key: str) -> bool:
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(seconds=self.ttl_seconds)
+        try:
+            db.add(ProcessedEvent(event_key=key, expires_at=expires_at))
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            existing = (await db.execute(select(ProcessedEvent).where(ProcessedEvent.event_key == key))).scalars().first()
+            if existing and existing.expires_at and existing.expires_at.replace(tzinfo=timezone.utc) > now:
+                return True
+            await db.execute(update(ProcessedEvent).where(ProcessedEvent.event_key == key).values(expires_at=expires_at))
+            await db.commit()
+            return False
+
+        self._inserts += 1
+        if self._inserts % self.purge_every == 0:
+            try:
+                await db.execute(delete(ProcessedEvent).where(ProcessedEvent.expires_at < now))
+                await db.commit()
+            except Exception as exc:
+                await db.rollback()
+                logger.warning("Failed to purge expired processed events: %s", exc)
+        return False
+
+
+event_dedupe = EventDeduplicator(
+    ttl_seconds=settings.EVENT_DEDUPE_TTL_SECONDS,
+    max_entries=settings.EVENT_DEDUPE_MAX_ENTRIES,
+    backend=settings.EVENT_DEDUPE_BACKEND,
+)
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+from typing import List, NamedTuple
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.services.workflows import trigger_workflows
+
+logger = logging.getLogger(__name__)
+
+
+class QueuedEvent(NamedTuple):
+    service: str
+    event_type: str
+    data: dict
+
+
+class EventWorkerPool:
+    """Bounded in-process queue drained by a fixed number of workflow workers."""
+
+    def __init__(self, workers: int = 4, queue_size: int = 1000, drain_timeout: float = 30.0):
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.drain_timeout = drain_timeout
+        self._queue: asyncio.Queue | None = None
+        self._tasks: List[asyncio.Task] = []
+        self._accepting = False
+
+    @property
+    def running(self) -> bool:
+        return self._accepting
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        loop = asyncio.get_running_loop()
+        self._tasks = [
+            loop.create_task(self._work(), name=f"event-worker-{idx}")
+            for idx in range(self.workers)
+        ]
+        self._accepting = True
+
+    def submit(self, service: str, event_type: str, data: dict) -> bool:
+        if not self._accepting or self._queue is None:
+            return False
+        try:
+            self._queue.put_nowait(QueuedEvent(service, event_type, data))
+        except asyncio.QueueFull:
+            logger.warning("Event queue full, rejecting %s.%s", service, event_type)
+            return False
+        return True
+
+    async def shutdown(self):
+        if not self._tasks:
+            return
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Event queue drain timed out with %d events left", self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    async def _work(self):
+        while True:
+            event = await self._queue.get()
+            try:
+                async with AsyncSessionLocal() as db:
+                    await trigger_workflows(event.service, event.event_type, event.data, db)
+            except Exception as exc:
+                logger.exception("Failed to process %s.%s event: %s", event.service, event.event_type, exc)
+            finally:
+                self._queue.task_done()
+
+
+event_workers = EventWorkerPool(
+    workers=settings.EVENT_WORKERS,
+    queue_size=settings.EVENT_QUEUE_SIZE,
+    drain_timeout=settings.EVENT_DRAIN_TIMEOUT,
+)
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.models import WorkflowEvent
+from app.services.http_clients import http_clients
+from app.services.run_history import run_history
+from app.services.workflows import dispatch_event
+
+logger = logging.getLogger(__name__)
+
+
+async def enqueue_event(db: AsyncSession, service: str, event_type: str, data: dict) -> WorkflowEvent:
+    event = WorkflowEvent(
+        service=service,
+        event_type=event_type,
+        payload=data,
+        status="pending",
+        attempts=0,
+        available_at=datetime.now(timezone.utc),
+    )
+    db.add(event)
+    await db.commit()
+    return event
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with full jitter, capped at EVENT_RETRY_MAX_SECONDS."""
+    ceiling = min(settings.EVENT_RETRY_MAX_SECONDS, settings.EVENT_RETRY_BASE_SECONDS * (2 ** max(0, attempts - 1)))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def failed_workflow_ids(outcomes) -> tuple[List[int], str | None]:
+    failed: List[int] = []
+    last_error = None
+    for ref, results in outcomes:
+        errors = [
+            result.get("error") for result in results
+            if not result.get("success") and not str(result.get("error", "")).startswith("Not implemented")
+        ]
+        if errors:
+            failed.append(ref.workflow_id)
+            last_error = f"workflow {ref.workflow_id}: {errors[-1]}"
+    return failed, last_error
+
+
+class DurableEventQueue:
+    """Workers claiming workflow_events rows with SELECT ... FOR UPDATE SKIP LOCKED.
+
+    Events are processed at least once: a failed workflow is retried with
+    backoff until EVENT_MAX_ATTEMPTS, then the event is moved to `dead`.
+    Retries skip the reactions recorded in completed_steps.
+    Rows stuck in `processing` past the lease (crashed worker) are reclaimed;
+    the lease restarts before each event of a batch, and events reclaimed
+    by another worker meanwhile are left to it.
+    """
+
+    def __init__(self, workers: int = 4, batch_size: int = 5, poll_interval: float = 1.0):
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.poll_interval = max(0.1, poll_interval)
+        self._stop_event = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        if self._tasks:
+            return
+        self._stop_event.clear()
+        loop = asyncio.get_running_loop()
+        self._tasks = [
+            loop.create_task(self._run(), name=f"event-queue-worker-{idx}")
+            for idx in range(self.workers)
+        ]
+
+    async def shutdown(self):
+        if not self._tasks:
+            return
+        self._stop_event.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self):
+        while not self._stop_event.is_set():
+            processed = 0
+            try:
+                processed = await self._process_batch()
+            except Exception as exc:
+                logger.exception("Event queue batch failed: %s", exc)
+
+            if processed:
+                continue
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                continue
+
+    async def _claim_batch(self, db: AsyncSession) -> List[WorkflowEvent]:
+        now = datetime.now(timezone.utc)
+        lease_expired = now - timedelta(seconds=settings.EVENT_LEASE_SECONDS)
+        result = await db.execute(
+            select(WorkflowEvent)
+            .where(or_(
+                and_(WorkflowEvent.status == "pending", WorkflowEvent.available_at <= now),
+                and_(WorkflowEvent.status == "processing", WorkflowEvent.locked_at < lease_expired),
+            ))
+            .order_by(WorkflowEvent.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        events = result.scalars().all()
+        for event in events:
+            event.status = "processing"
+            event.locked_at = now
+            event.attempts = (event.attempts or 0) + 1
+        await db.commit()
+        return events
+
+    async def _process_batch(self) -> int:
+        async with AsyncSessionLocal() as db:
+            events = await self._claim_batch(db)
+            for event in events:
+                if not await self._renew_lease(db, event):
+                    logger.info("Event %s was reclaimed by another worker, skipping it", event.id)
+                    continue
+                await self._process(db, event)
+            return len(events)
+
+    async def _renew_lease(self, db: AsyncSession, event: WorkflowEvent) -> bool:
+        """Restart the lease of a claimed event; False if its lease expired and it was claimed again."""
+        # Every claim increments attempts, so it tells this claim apart from a later one.
+        result = await db.execute(
+            update(WorkflowEvent)
+            .where(
+                WorkflowEvent.id == event.id,
+                WorkflowEvent.status == "processing",
+                WorkflowEvent.attempts == event.attempts,
+            )
+            .values(locked_at=datetime.now(timezone.utc))
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return result.rowcount == 1
+
+    async def _process(self, db: AsyncSession, event: WorkflowEvent):
+        # Reactions that succeeded on an earlier attempt are not sent again.
+        completed = {
+            int(workflow_id): set(orders)
+            for workflow_id, orders in (event.completed_steps or {}).items()
+        }
+        try:
+            outcomes = await dispatch_event(event.service, event.event_type, event.payload or {}, db, event.workflow_ids, completed)
+            failed, last_error = failed_workflow_ids(outcomes)
+        except Exception as exc:
+            logger.exception("Event %s crashed: %s", event.id, exc)
+            failed, last_error = event.workflow_ids, str(exc)
+
+        if failed == []:
+            event.status = "done"
+            event.last_error = None
+        elif event.attempts >= settings.EVENT_MAX_ATTEMPTS:
+            event.status = "dead"
+            event.workflow_ids = failed
+            event.last_error = last_error
+            logger.error("Event %s moved to dead letter after %d attempts: %s", event.id, event.attempts, last_error)
+        else:
+            event.status = "pending"
+            event.workflow_ids = failed
+            event.last_error = last_error
+            event.available_at = datetime.now(timezone.utc) + timedelta(seconds=retry_delay(event.attempts))
+        # JSON object keys are strings; only workflows that will be retried matter.
+        event.completed_steps = {
+            str(workflow_id): sorted(orders)
+            for workflow_id, orders in completed.items()
+            if orders and (failed is None or workflow_id in failed)
+        } or None
+        event.locked_at = None
+        await db.commit()
+
+
+event_queue = DurableEventQueue(
+    workers=settings.EVENT_WORKERS,
+    batch_size=settings.EVENT_QUEUE_BATCH_SIZE,
+    poll_interval=settings.EVENT_QUEUE_POLL_INTERVAL,
+)
+
+
+async def run_worker():
+    """Entry point for dedicated worker processes: `python -m app.services.event_queue`."""
+    logging.basicConfig(level=logging.INFO)
+    run_history.start()
+    event_queue.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await event_queue.shutdown()
+        await run_history.shutdown()
+        await http_clients.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())
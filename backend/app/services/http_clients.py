@@ -0,0 +1,130 @@
+import logging
+from typing import Dict, NamedTuple
+
+import httpx
+
+from app.config import settings
+from app.services.circuit_breakers import GuardedTransport, provider_guards
+from app.services.rate_limits import ProviderRateLimiter, RateLimitedTransport
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderHTTPConfig(NamedTuple):
+    timeout: float
+    max_connections: int
+    max_keepalive_connections: int
+    rate_per_second: float
+
+
+def default_config() -> ProviderHTTPConfig:
+    return ProviderHTTPConfig(
+        timeout=settings.HTTP_TIMEOUT,
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+        rate_per_second=settings.RATE_LIMIT_DEFAULT_RPS,
+    )
+
+
+# Per-provider overrides of the defaults above. Gmail lookups fan out one request per message;
+# rates are the documented per-credential limits (Discord: 50/s global, Twitch: 800/min).
+PROVIDER_HTTP_CONFIG: Dict[str, ProviderHTTPConfig] = {
+    "google": default_config()._replace(max_connections=settings.HTTP_MAX_CONNECTIONS * 2),
+    "discord": default_config()._replace(rate_per_second=50),
+    "twitch": default_config()._replace(rate_per_second=800 / 60),
+}
+
+
+class SharedTransport(httpx.AsyncBaseTransport):
+    """Hands a provider's pooled transport to short-lived clients without letting them close it.
+
+    authlib builds a new AsyncOAuth2Client inside `async with` for every call,
+    which would otherwise close the pool on exit.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self):
+        pass
+
+
+class HTTPClientRegistry:
+    """One keep-alive connection pool and AsyncClient per provider, closed at shutdown.
+
+    Every pool sits behind the provider's circuit breaker and bulkhead and, with
+    rate limiting enabled, a RateLimitedTransport, so handler calls and authlib
+    calls to a provider share the same buckets and breaker.
+    """
+
+    def __init__(self, http2: bool = False, keepalive_expiry: float = 30.0, rate_limit: bool = True):
+        self.http2 = http2
+        self.keepalive_expiry = keepalive_expiry
+        self.rate_limit = rate_limit
+        self.limiter = ProviderRateLimiter()
+        self._transports: Dict[str, httpx.AsyncBaseTransport] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def config(self, provider: str) -> ProviderHTTPConfig:
+        return PROVIDER_HTTP_CONFIG.get(provider) or default_config()
+
+    def _pool(self, provider: str) -> httpx.AsyncBaseTransport:
+        pool = self._transports.get(provider)
+        if pool is None:
+            config = self.config(provider)
+            pool = httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(
+                    max_connections=config.max_connections,
+                    max_keepalive_connections=config.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                http2=self.http2,
+            )
+            # The guard sits below the rate limiter so it only sees time spent at the provider.
+            pool = GuardedTransport(pool, provider_guards.get(provider))
+            if self.rate_limit:
+                pool = RateLimitedTransport(
+                    pool,
+                    provider,
+                    self.limiter,
+                    rate=config.rate_per_second,
+                    max_retries=settings.RATE_LIMIT_MAX_RETRIES,
+                    max_wait=settings.RATE_LIMIT_MAX_WAIT,
+                )
+            self._transports[provider] = pool
+        return pool
+
+    def transport(self, provider: str) -> SharedTransport:
+        """Transport for clients created elsewhere (e.g. authlib) that should reuse the provider pool."""
+        return SharedTransport(self._pool(provider))
+
+    def get(self, provider: str) -> httpx.AsyncClient:
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                transport=self.transport(provider),
+                timeout=self.config(provider).timeout,
+            )
+            self._clients[provider] = client
+        return client
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+        transports, self._transports = self._transports, {}
+        for provider, transport in transports.items():
+            try:
+                await transport.aclose()
+            except Exception as exc:
+                logger.warning("Failed to close %s HTTP pool: %s", provider, exc)
+
+
+http_clients = HTTPClientRegistry(
+    http2=settings.HTTP_HTTP2,
+    keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    rate_limit=settings.RATE_LIMIT_ENABLED,
+)
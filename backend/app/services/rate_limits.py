@@ -0,0 +1,251 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Path segments whose id selects its own Discord rate limit bucket ("major parameters").
+DISCORD_MAJOR_PARAMS = {"channels", "guilds", "webhooks"}
+
+BucketKey = Tuple[str, str, str, str]
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` per second, corrected by what the provider reports.
+
+    Callers wait in FIFO order when the bucket is empty or blocked, so a burst is
+    queued and spread out instead of being answered with 429s. A caller that
+    would wait longer than its `max_wait` gives up instead of holding the queue.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = max(0.01, rate)
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _wait(self, now: float) -> float:
+        """Seconds until a token is free, not counting callers queued ahead."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    async def acquire(self, max_wait: float | None = None) -> float | None:
+        """Take a token; return None once taken, or the remaining wait if it exceeds `max_wait`.
+
+        `max_wait` bounds the whole call, time queued behind other callers included.
+        """
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        try:
+            await asyncio.wait_for(self._lock.acquire(), timeout=max_wait)
+        except asyncio.TimeoutError:
+            return max(self._wait(time.monotonic()), max_wait)
+        try:
+            while True:
+                now = time.monotonic()
+                wait = self._wait(now)
+                if wait <= 0:
+                    self.tokens -= 1
+                    return None
+                if deadline is not None and now + wait > deadline:
+                    return wait
+                await asyncio.sleep(wait)
+        finally:
+            self._lock.release()
+
+    def update(self, limit: float | None, remaining: float | None, reset_after: float | None):
+        now = time.monotonic()
+        self._refill(now)
+        if limit and reset_after and reset_after > 0:
+            self.capacity = max(1.0, limit)
+            self.rate = max(0.01, limit / reset_after)
+        if remaining is not None:
+            self.tokens = min(self.tokens, remaining)
+            if remaining <= 0 and reset_after:
+                self.block(reset_after)
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+def _header_float(headers: httpx.Headers, *names: str) -> float | None:
+    for name in names:
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return float(value)
+        except ValueError:
+            continue
+    return None
+
+
+def parse_rate_limit_headers(headers: httpx.Headers) -> Tuple[float | None, float | None, float | None]:
+    """Return (limit, remaining, seconds until reset) from Discord, Twitch and X style headers."""
+    limit = _header_float(headers, "x-ratelimit-limit", "ratelimit-limit", "x-rate-limit-limit")
+    remaining = _header_float(headers, "x-ratelimit-remaining", "ratelimit-remaining", "x-rate-limit-remaining")
+    reset_after = _header_float(headers, "x-ratelimit-reset-after")
+    if reset_after is None:
+        reset_at = _header_float(headers, "ratelimit-reset", "x-rate-limit-reset", "x-ratelimit-reset")
+        if reset_at is not None:
+            reset_after = max(0.0, reset_at - time.time())
+    return limit, remaining, reset_after
+
+
+def parse_retry_after(response: httpx.Response) -> float | None:
+    value = response.headers.get("retry-after")
+    if value is not None:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    try:
+        retry_after = response.json().get("retry_after")
+    except Exception:
+        retry_after = None
+    if isinstance(retry_after, (int, float)):
+        return max(0.0, float(retry_after))
+    _, _, reset_after = parse_rate_limit_headers(response.headers)
+    return reset_after
+
+
+def credential_key(request: httpx.Request) -> str:
+    authorization = request.headers.get("authorization")
+    if not authorization:
+        return "anonymous"
+    return hashlib.sha256(authorization.encode()).hexdigest()[:16]
+
+
+def discord_route(request: httpx.Request) -> Tuple[str, str]:
+    """Route template and major parameter of a Discord API request."""
+    segments = [segment for segment in request.url.path.split("/") if segment]
+    if segments and segments[0] == "api":
+        segments = segments[1:]
+    if segments and segments[0].startswith("v") and segments[0][1:].isdigit():
+        segments = segments[1:]
+
+    template: List[str] = []
+    major = ""
+    for idx, segment in enumerate(segments):
+        if segment.isdigit():
+            previous = segments[idx - 1] if idx else ""
+            if previous in DISCORD_MAJOR_PARAMS and not major:
+                major = segment
+            template.append(":id")
+        else:
+            template.append(segment)
+    return f"{request.method} /{'/'.join(template)}", major
+
+
+class ProviderRateLimiter:
+    """Buckets per provider and credential, plus Discord per-route buckets learned from X-RateLimit-Bucket."""
+
+    def __init__(self, max_buckets: int = 10000):
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[BucketKey, TokenBucket]" = OrderedDict()
+        self._route_buckets: Dict[Tuple[str, str], str] = {}
+
+    def _bucket(self, key: BucketKey, rate: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rate, rate)
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(key)
+        return bucket
+
+    def _keys(self, provider: str, request: httpx.Request) -> Tuple[BucketKey, BucketKey | None]:
+        credential = credential_key(request)
+        credential_bucket = (provider, credential, "", "")
+        if provider != "discord":
+            return credential_bucket, None
+        route, major = discord_route(request)
+        bucket_id = self._route_buckets.get((provider, route), route)
+        return credential_bucket, (provider, credential, bucket_id, major)
+
+    async def acquire(self, provider: str, request: httpx.Request, rate: float, max_wait: float | None = None) -> float | None:
+        """Wait for the request's buckets; return None, or the remaining wait if it exceeds `max_wait`."""
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        credential_bucket, route_bucket = self._keys(provider, request)
+        wait = await self._bucket(credential_bucket, rate).acquire(max_wait)
+        if wait is None and route_bucket is not None:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            wait = await self._bucket(route_bucket, rate).acquire(remaining)
+        return wait
+
+    def observe(self, provider: str, request: httpx.Request, response: httpx.Response, rate: float) -> float | None:
+        """Record the limits reported by `response`; return the wait before a retry if it was a 429."""
+        if provider == "discord":
+            bucket_hash = response.headers.get("x-ratelimit-bucket")
+            if bucket_hash:
+                route, _ = discord_route(request)
+                self._route_buckets[(provider, route)] = bucket_hash
+        credential_bucket, route_bucket = self._keys(provider, request)
+
+        limit, remaining, reset_after = parse_rate_limit_headers(response.headers)
+        reported = route_bucket or credential_bucket
+        if remaining is not None:
+            self._bucket(reported, rate).update(limit, remaining, reset_after)
+
+        if response.status_code != 429:
+            return None
+        retry_after = parse_retry_after(response)
+        if retry_after is None:
+            retry_after = 1.0
+        is_global = response.headers.get("x-ratelimit-global") or response.headers.get("x-ratelimit-scope") == "global"
+        self._bucket(credential_bucket if is_global else reported, rate).block(retry_after)
+        logger.warning("%s rate limited %s %s, retrying in %.2fs", provider, request.method, request.url.path, retry_after)
+        return retry_after
+
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """Waits for the provider's buckets before each request and retries 429s after Retry-After.
+
+    Waits longer than `max_wait` are not sat out: the caller gets a 429 with
+    Retry-After right away, the same as when the provider asks for a long wait.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, provider: str, limiter: ProviderRateLimiter, rate: float, max_retries: int = 3, max_wait: float = 60.0):
+        self._transport = transport
+        self.provider = provider
+        self.limiter = limiter
+        self.rate = rate
+        self.max_retries = max(0, max_retries)
+        self.max_wait = max_wait
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            wait = await self.limiter.acquire(self.provider, request, self.rate, self.max_wait)
+            if wait is not None:
+                logger.warning("%s rate limit wait of %.2fs for %s %s exceeds the limit", self.provider, wait, request.method, request.url.path)
+                return httpx.Response(429, headers={"Retry-After": str(math.ceil(wait))}, request=request)
+            response = await self._transport.handle_async_request(request)
+            if response.status_code == 429:
+                await response.aread()
+            retry_after = self.limiter.observe(self.provider, request, response, self.rate)
+            if retry_after is None or attempt >= self.max_retries or retry_after > self.max_wait:
+                return response
+            await response.aclose()
+            attempt += 1
+
+    async def aclose(self):
+        await self._transport.aclose()
@@ -1,13 +1,15 @@
-from app.services.token_storage import refresh_oauth_token
+from app.services.token_storage import refresh_oauth_token, uses_token
 from app.routers.oauth import oauth
 from sqlalchemy.orm import Session
 from typing import Dict, Any, Callable
 from datetime import datetime, timedelta, timezone
-import httpx
+from app.services.http_clients import http_clients
+from app.services.circuit_breakers import provider_guards
 import base64
 from email.mime.text import MIMEText
 from app.config import settings
 
+@uses_token("twitter")
 async def twitter_tweet_reaction(db: Session, user_id: int, params: dict):
     token = await refresh_oauth_token(db, user_id, "twitter")
     if not token:
@@ -26,6 +28,7 @@ async def twitter_tweet_reaction(db: Session, user_id: int, params: dict):
     else:
         return {"error": resp.json()}
 
+@uses_token("google")
 async def google_send_mail_reaction(db: Session, user_id: int, params: dict):
     token = await refresh_oauth_token(db, user_id, "google")
     if not token:
@@ -52,6 +55,7 @@ async def google_send_mail_reaction(db: Session, user_id: int, params: dict):
         except Exception:
             return {"error": resp.text}
 
+@uses_token("google")
 async def google_calendar_event_reaction(db: Session, user_id: int, params: dict):
     token = await refresh_oauth_token(db, user_id, "google")
     if not token:
@@ -115,16 +119,16 @@ async def discord_send_message_reaction(db: Session, user_id: int, params: dict)
     if not bot_token:
         return {"error": "Discord bot token not configured"}
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"https://discord.com/api/channels/{channel_id}/messages",
-            headers={
-                "Authorization": f"Bot {bot_token}",
-                "Content-Type": "application/json"
-            },
-            json={"content": message},
-            timeout=10.0
-        )
+    client = http_clients.get("discord")
+    response = await client.post(
+        f"https://discord.com/api/channels/{channel_id}/messages",
+        headers={
+            "Authorization": f"Bot {bot_token}",
+            "Content-Type": "application/json"
+        },
+        json={"content": message},
+        timeout=10.0
+    )
 
     if response.status_code in (200, 201):
         data = response.json()
@@ -134,6 +138,7 @@ async def discord_send_message_reaction(db: Session, user_id: int, params: dict)
     except Exception:
         return {"error": response.text}
 
+@uses_token("spotify")
 async def spotify_play_playlist_reaction(db: Session, user_id: int, params: dict):
     token = await refresh_oauth_token(db, user_id, "spotify")
     if not token:
@@ -152,6 +157,7 @@ async def spotify_play_playlist_reaction(db: Session, user_id: int, params: dict
     else:
         return {"error": resp.json()}
 
+@uses_token("spotify")
 async def spotify_play_track_reaction(db: Session, user_id: int, params: dict):
     token = await refresh_oauth_token(db, user_id, "spotify")
     if not token:
@@ -176,10 +182,11 @@ REACTION_DISPATCH: Dict[tuple[str, str], Callable[[Session, int, dict], Any]] =
     ("google", "create_calendar_event"): google_calendar_event_reaction,
     ("discord", "send_channel_message"): discord_send_message_reaction,
     ("spotify", "play_playlist"): spotify_play_playlist_reaction,
+    ("spotify", "play_track"): spotify_play_track_reaction,
 }
 
 async def execute_reaction(service: str, event: str, db: Session, user_id: int, params: dict):
     func = REACTION_DISPATCH.get((service, event))
     if not func:
         raise NotImplementedError(f"No reaction for {service}:{event}")
-    return await func(db, user_id, params)
+    return await provider_guards.call(service, func, db, user_id, params)
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry(NamedTuple):
+    value: Any
+    fresh_until: float
+    stale_until: float
+
+
+class AsyncTTLCache:
+    """Bounded LRU of loader results with a TTL and a stale-while-revalidate window.
+
+    Fresh entries are returned as is. Stale entries are returned immediately
+    while a single background task reloads them. Concurrent misses on the same
+    key share one load, which runs in its own task so that a cancelled caller
+    does not cancel it for the others; loaders must therefore not borrow the
+    caller's session. Failed loads are never cached.
+    """
+
+    def __init__(self, name: str, ttl: float, stale_ttl: float = 0.0, max_entries: int = 1000):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = max(0.0, stale_ttl)
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._loading: Dict[Hashable, asyncio.Task] = {}
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if now < entry.fresh_until:
+                self._entries.move_to_end(key)
+                return entry.value
+            if now < entry.stale_until:
+                self._entries.move_to_end(key)
+                if key not in self._loading:
+                    self._start_load(key, loader).add_done_callback(lambda task: self._log_refresh(key, task))
+                return entry.value
+
+        task = self._loading.get(key)
+        if task is None:
+            task = self._start_load(key, loader)
+        return await asyncio.shield(task)
+
+    def _start_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        # Registered before any await so that concurrent callers see the load in flight.
+        task = asyncio.get_running_loop().create_task(self._load(key, loader))
+        # Mark the exception as retrieved when nobody else was waiting on it.
+        task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        self._loading[key] = task
+        return task
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await loader()
+            self.set(key, value)
+            return value
+        finally:
+            self._loading.pop(key, None)
+
+    def _log_refresh(self, key: Hashable, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Background refresh of %s cache key %r failed: %s", self.name, key, task.exception())
+
+    def set(self, key: Hashable, value: Any):
+        now = time.monotonic()
+        self._entries[key] = CacheEntry(value, now + self.ttl, now + self.ttl + self.stale_ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import insert
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.models import WorkflowRun, WorkflowStepRun
+
+logger = logging.getLogger(__name__)
+
+
+def truncate_output(value: Any, limit: int) -> str | None:
+    if value is None:
+        return None
+    try:
+        text = value if isinstance(value, str) else json.dumps(value, default=str, ensure_ascii=False)
+    except Exception:
+        text = str(value)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+class RunHistoryWriter:
+    """Buffers workflow run records and bulk-inserts them off the hot path.
+
+    A flush happens every `batch_size` buffered runs or every `flush_interval_ms`,
+    whichever comes first, in a worker thread so inserts never block the event loop.
+    """
+
+    def __init__(self, batch_size: int = 200, flush_interval_ms: int = 1000, output_limit: int = 2000, max_buffer: int = 10000):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(10, flush_interval_ms) / 1000
+        self.output_limit = output_limit
+        self.max_buffer = max(self.batch_size, max_buffer)
+        self._runs: List[Dict[str, Any]] = []
+        self._step_runs: List[Dict[str, Any]] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task and not self._task.done():
+            return
+        self._stopping = False
+        self._wakeup.clear()
+        loop = asyncio.get_running_loop()
+        self._task = loop.create_task(self._run(), name="run-history-writer")
+
+    async def shutdown(self):
+        if not self._task:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await self._task
+        finally:
+            self._task = None
+
+    def record(
+        self,
+        workflow_id: int,
+        user_id: int,
+        service: str,
+        event_type: str,
+        started_at: datetime,
+        duration: float,
+        step_runs: List[Tuple[Any, dict, Any, datetime, float]],
+    ):
+        if not settings.RUN_HISTORY_ENABLED:
+            return
+        if len(self._runs) >= self.max_buffer:
+            logger.warning("Run history buffer full, dropping run of workflow %s", workflow_id)
+            return
+
+        run_id = uuid.uuid4().hex
+        failed = any(not result.get("success") for _, result, _, _, _ in step_runs)
+        self._runs.append({
+            "id": run_id,
+            "workflow_id": workflow_id,
+            "user_id": user_id,
+            "service": service,
+            "event_type": event_type,
+            "status": "failed" if failed else "success",
+            "started_at": started_at,
+            "duration_ms": int(duration * 1000),
+        })
+        for step, result, output, step_started_at, step_duration in step_runs:
+            self._step_runs.append({
+                "run_id": run_id,
+                "step_order": step.step_order,
+                "type": step.type,
+                "service": step.service,
+                "event": step.event,
+                "status": "success" if result.get("success") else "failed",
+                "started_at": step_started_at,
+                "duration_ms": int(step_duration * 1000),
+                "error": truncate_output(result.get("error"), self.output_limit),
+                "output": truncate_output(output, self.output_limit),
+            })
+
+        if len(self._runs) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if self._stopping:
+                return
+
+    async def flush(self):
+        if not self._runs:
+            return
+        runs, step_runs = self._runs, self._step_runs
+        self._runs, self._step_runs = [], []
+        try:
+            await asyncio.to_thread(self._insert, runs, step_runs)
+        except Exception as exc:
+            logger.exception("Failed to write %d workflow runs: %s", len(runs), exc)
+
+    @staticmethod
+    def _insert(runs: List[Dict[str, Any]], step_runs: List[Dict[str, Any]]):
+        db = SessionLocal()
+        try:
+            db.execute(insert(WorkflowRun), runs)
+            if step_runs:
+                db.execute(insert(WorkflowStepRun), step_runs)
+            db.commit()
+        finally:
+            db.close()
+
+
+run_history = RunHistoryWriter(
+    batch_size=settings.RUN_HISTORY_BATCH_SIZE,
+    flush_interval_ms=settings.RUN_HISTORY_FLUSH_MS,
+    output_limit=settings.RUN_HISTORY_OUTPUT_LIMIT,
+)
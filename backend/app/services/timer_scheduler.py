@@ -1,102 +1,247 @@
 import asyncio
+import heapq
+import itertools
 import logging
-from datetime import datetime, timedelta, timezone
-from typing import Dict
+import random
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, NamedTuple, Set, Tuple
 
-from sqlalchemy.orm import Session
+from sqlalchemy import select
 
-from app.database import SessionLocal
+from app.config import settings
+from app.database import AsyncSessionLocal
 from app.models.models import Workflow, WorkflowStep
 from app.services.timer_utils import parse_interval_minutes
-from app.services.workflows import trigger_workflows
 
 logger = logging.getLogger(__name__)
 
 
+class TimerSpec(NamedTuple):
+    step_id: int
+    workflow_id: int
+    event: str
+    interval_minutes: int
+    params: dict
+
+
+class TimerEntry(NamedTuple):
+    spec: TimerSpec
+    due: float
+    version: int
+
+
+def timer_specs(workflow) -> List[TimerSpec]:
+    """Timer trigger steps of an active workflow with a usable interval."""
+    if not workflow.active:
+        return []
+    specs = []
+    for step in workflow.steps:
+        if step.type != "action" or step.service != "timer":
+            continue
+        params = dict(step.params or {})
+        interval_minutes = parse_interval_minutes(params)
+        if interval_minutes is None:
+            continue
+        specs.append(TimerSpec(step.id, workflow.id, step.event, interval_minutes, params))
+    return specs
+
+
 class TimerWorkflowScheduler:
-    def __init__(self, poll_interval: int = 15):
-        self.poll_interval = max(1, poll_interval)
+    """Fires timer workflows from a min-heap of due times instead of polling every timer step.
+
+    The loop sleeps until the earliest due time or until a workflow change
+    wakes it. Workflow saves, toggles and deletes update the heap through
+    `update_workflow` / `remove_workflow`; replaced entries are skipped lazily
+    when they reach the top. A full reload every `resync_interval` seconds
+    catches changes made by other processes.
+
+    At most `max_concurrency` timers run at once so a batch of due timers does
+    not drain the database pool, and timers found by a reload (startup
+    included) are spread over `spread` seconds instead of all firing at once.
+    """
+
+    def __init__(self, resync_interval: int = 600, max_concurrency: int = 4, spread: float = 60.0):
+        self.resync_interval = resync_interval
+        self.spread = max(0.0, spread)
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
         self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
         self._stop_event = asyncio.Event()
-        self._next_run: Dict[int, datetime] = {}
+        self._wakeup = asyncio.Event()
+        self._heap: List[Tuple[float, int, int]] = []
+        self._timers: Dict[int, TimerEntry] = {}
+        self._by_workflow: Dict[int, Set[int]] = {}
+        self._versions = itertools.count()
+        self._firing: Set[asyncio.Task] = set()
 
     def start(self):
         if self._task and not self._task.done():
             return
         self._stop_event.clear()
-        loop = asyncio.get_running_loop()
-        self._task = loop.create_task(self._run(), name="timer-workflow-loop")
+        self._loop = asyncio.get_running_loop()
+        self._task = self._loop.create_task(self._run(), name="timer-workflow-loop")
 
     async def shutdown(self):
         if not self._task:
             return
         self._stop_event.set()
+        self._wakeup.set()
         try:
             await self._task
+            if self._firing:
+                await asyncio.gather(*self._firing, return_exceptions=True)
         finally:
             self._task = None
+            self._loop = None
 
-    async def _run(self):
-        while not self._stop_event.is_set():
-            try:
-                await self._tick()
-            except Exception as exc:
-                logger.exception("Timer scheduler tick failed: %s", exc)
+    def update_workflow(self, workflow):
+        """Reschedule the timers of a saved or toggled workflow; unchanged timers keep their due time."""
+        specs = timer_specs(workflow)
+        self._call(self._replace_workflow, workflow.id, specs)
 
-            try:
-                await asyncio.wait_for(self._stop_event.wait(), timeout=self.poll_interval)
-            except asyncio.TimeoutError:
-                continue
+    def remove_workflow(self, workflow_id: int):
+        self._call(self._replace_workflow, workflow_id, [])
 
-    async def _tick(self):
-        db: Session = SessionLocal()
+    def _call(self, func: Callable, *args):
+        # Sync routes run in a worker thread: hand the change to the scheduler's loop.
+        loop = self._loop
+        if loop is None:
+            func(*args)
+            return
         try:
-            steps = (
-                db.query(WorkflowStep)
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            func(*args)
+        else:
+            loop.call_soon_threadsafe(func, *args)
+
+    def _replace_workflow(self, workflow_id: int, specs: Iterable[TimerSpec], spread: float = 0.0):
+        now = time.monotonic()
+        previous = self._by_workflow.pop(workflow_id, set())
+        current = set()
+        for spec in specs:
+            current.add(spec.step_id)
+            entry = self._timers.get(spec.step_id)
+            if entry is not None and entry.spec == spec:
+                continue
+            # New or changed timers fire right away (within `spread`), then every interval.
+            delay = random.uniform(0, min(spread, spec.interval_minutes * 60)) if spread else 0.0
+            self._schedule(spec, now + delay)
+        for step_id in previous - current:
+            self._timers.pop(step_id, None)
+        if current:
+            self._by_workflow[workflow_id] = current
+        self._wakeup.set()
+
+    def _schedule(self, spec: TimerSpec, due: float):
+        version = next(self._versions)
+        self._timers[spec.step_id] = TimerEntry(spec, due, version)
+        heapq.heappush(self._heap, (due, version, spec.step_id))
+
+    async def _load_all(self):
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(WorkflowStep)
                 .join(Workflow)
-                .filter(
+                .where(
                     WorkflowStep.type == "action",
                     WorkflowStep.service == "timer",
                     Workflow.active == True,
                 )
-                .all()
             )
+            steps = result.scalars().all()
 
-            active_step_ids = {step.id for step in steps}
-            now = datetime.now(timezone.utc)
-            for step_id in list(self._next_run.keys()):
-                if step_id not in active_step_ids:
-                    self._next_run.pop(step_id, None)
-            for step in steps:
-                params = dict(step.params or {})
-                interval_minutes = parse_interval_minutes(params)
-                if interval_minutes is None:
-                    continue
-                next_run = self._next_run.setdefault(step.id, now)
-                if now < next_run:
-                    continue
-                payload = {
-                    "step_id": step.id,
-                    "workflow_id": step.workflow_id,
-                    "triggered_at": now.isoformat(),
-                    "interval_minutes": interval_minutes,
-                    "interval_seconds": interval_minutes * 60,
-                }
-                if params:
-                    payload["timer_params"] = params
+        specs_by_workflow: Dict[int, List[TimerSpec]] = {}
+        for step in steps:
+            params = dict(step.params or {})
+            interval_minutes = parse_interval_minutes(params)
+            if interval_minutes is None:
+                continue
+            specs_by_workflow.setdefault(step.workflow_id, []).append(
+                TimerSpec(step.id, step.workflow_id, step.event, interval_minutes, params)
+            )
+        for workflow_id in set(self._by_workflow) | set(specs_by_workflow):
+            self._replace_workflow(workflow_id, specs_by_workflow.get(workflow_id, []), self.spread)
+        # Drop heap entries left behind by replaced timers.
+        self._heap = [item for item in self._heap if self._is_current(item)]
+        heapq.heapify(self._heap)
+
+    def _is_current(self, item: Tuple[float, int, int]) -> bool:
+        _, version, step_id = item
+        entry = self._timers.get(step_id)
+        return entry is not None and entry.version == version
 
+    async def _run(self):
+        next_resync = 0.0
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            if now >= next_resync:
                 try:
-                    await trigger_workflows("timer", step.event, payload, db)
+                    await self._load_all()
                 except Exception as exc:
-                    logger.exception(
-                        "Failed to trigger timer workflow %s (step %s): %s",
-                        step.workflow_id,
-                        step.id,
-                        exc,
-                    )
-                finally:
-                    self._next_run[step.id] = now + timedelta(minutes=interval_minutes)
-        finally:
-            db.close()
+                    logger.exception("Timer scheduler reload failed: %s", exc)
+                next_resync = now + self.resync_interval if self.resync_interval > 0 else float("inf")
+
+            self._fire_due(time.monotonic())
+
+            while self._heap and not self._is_current(self._heap[0]):
+                heapq.heappop(self._heap)
+            timeout = next_resync - time.monotonic()
+            if self._heap:
+                timeout = min(timeout, self._heap[0][0] - time.monotonic())
+            self._wakeup.clear()
+            if timeout <= 0:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=None if timeout == float("inf") else timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _fire_due(self, now: float):
+        triggered_at = datetime.now(timezone.utc)
+        while self._heap and self._heap[0][0] <= now:
+            item = heapq.heappop(self._heap)
+            if not self._is_current(item):
+                continue
+            entry = self._timers[item[2]]
+            interval = entry.spec.interval_minutes * 60
+            # Keep a steady cadence, but do not replay ticks missed while the process was busy or down.
+            next_due = entry.due + interval
+            self._schedule(entry.spec, next_due if next_due > now else now + interval)
+
+            task = asyncio.create_task(self._fire(entry.spec, triggered_at))
+            self._firing.add(task)
+            task.add_done_callback(self._firing.discard)
+
+    async def _fire(self, spec: TimerSpec, triggered_at: datetime):
+        from app.services.workflows import trigger_workflows
+
+        payload = {
+            "step_id": spec.step_id,
+            "workflow_id": spec.workflow_id,
+            "triggered_at": triggered_at.isoformat(),
+            "interval_minutes": spec.interval_minutes,
+            "interval_seconds": spec.interval_minutes * 60,
+        }
+        if spec.params:
+            payload["timer_params"] = spec.params
+
+        try:
+            async with self._semaphore, AsyncSessionLocal() as db:
+                await trigger_workflows("timer", spec.event, payload, db)
+        except Exception as exc:
+            logger.exception(
+                "Failed to trigger timer workflow %s (step %s): %s",
+                spec.workflow_id,
+                spec.step_id,
+                exc,
+            )
 
-scheduler = TimerWorkflowScheduler()
+scheduler = TimerWorkflowScheduler(
+    resync_interval=settings.TIMER_RESYNC_SECONDS,
+    max_concurrency=settings.TIMER_MAX_CONCURRENCY,
+    spread=settings.TIMER_SPREAD_SECONDS,
+)
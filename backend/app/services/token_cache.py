@@ -0,0 +1,94 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Tuple
+
+from app.config import settings
+
+TokenKey = Tuple[int, str]
+
+# Returned by `get` when the key is not cached, since None means "no token".
+MISSING = object()
+
+
+class CachedToken(NamedTuple):
+    token: Dict[str, Any] | None
+    valid_until: float
+
+
+class OAuthTokenCache:
+    """Decoded OAuth tokens keyed by (user_id, provider), dropped before the token expires.
+
+    Entries live for at most `ttl` seconds so that changes made by another
+    process are picked up, and never past the token's own `expires_at` minus
+    `expiry_margin`. Concurrent loads or refreshes of the same key share a
+    single call. Callers get copies and may modify them.
+    """
+
+    def __init__(self, ttl: float = 300.0, max_entries: int = 10000, expiry_margin: float = 30.0):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.expiry_margin = expiry_margin
+        self._entries: "OrderedDict[TokenKey, CachedToken]" = OrderedDict()
+        self._loading: Dict[TokenKey, asyncio.Task] = {}
+
+    def get(self, key: TokenKey) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        if time.monotonic() >= entry.valid_until:
+            self._entries.pop(key, None)
+            return MISSING
+        self._entries.move_to_end(key)
+        return dict(entry.token) if entry.token is not None else None
+
+    def set(self, key: TokenKey, token: Dict[str, Any] | None):
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        valid_until = now + self.ttl
+        expires_at = (token or {}).get("expires_at")
+        if expires_at:
+            valid_until = min(valid_until, now + float(expires_at) - time.time() - self.expiry_margin)
+        if valid_until <= now:
+            self._entries.pop(key, None)
+            return
+        self._entries[key] = CachedToken(dict(token) if token is not None else None, valid_until)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def load(self, key: TokenKey, loader: Callable[[], Awaitable[Dict[str, Any] | None]]) -> Dict[str, Any] | None:
+        """Run `loader` once for all concurrent callers of `key` and cache its result; errors are not cached.
+
+        The loader runs in its own task, so a cancelled caller does not cancel
+        the load for the others; it must not rely on the caller's session.
+        """
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._load(key, loader))
+            task.add_done_callback(lambda task: task.cancelled() or task.exception())
+            self._loading[key] = task
+        token = await asyncio.shield(task)
+        return dict(token) if token is not None else None
+
+    async def _load(self, key: TokenKey, loader: Callable[[], Awaitable[Dict[str, Any] | None]]) -> Dict[str, Any] | None:
+        try:
+            token = await loader()
+            self.set(key, token)
+            return token
+        finally:
+            self._loading.pop(key, None)
+
+    def invalidate(self, key: TokenKey):
+        self._entries.pop(key, None)
+
+    def invalidate_user(self, user_id: int):
+        for key in [key for key in self._entries if key[0] == user_id]:
+            self._entries.pop(key, None)
+
+
+token_cache = OAuthTokenCache(
+    ttl=settings.TOKEN_CACHE_TTL,
+    max_entries=settings.TOKEN_CACHE_MAX_ENTRIES,
+)
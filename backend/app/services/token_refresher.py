@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+
+from sqlalchemy import exists, select
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.models import UserService, Workflow, WorkflowStep
+from app.services.token_cache import TokenKey
+from app.services.token_storage import refresh_expiring_token
+
+logger = logging.getLogger(__name__)
+
+
+class TokenRefresher:
+    """Refreshes OAuth tokens shortly before they expire so workflow runs rarely refresh inline.
+
+    Each pass reads, through the token_expires_at index, up to `batch_size`
+    tokens expiring within `lead_seconds` that belong to users with an active
+    workflow using the provider, and refreshes them `concurrency` at a time.
+    Tokens that could not be refreshed are skipped for `retry_seconds`.
+    """
+
+    def __init__(self, interval: int = 60, lead_seconds: int = 600, batch_size: int = 50, concurrency: int = 5, retry_seconds: int = 900):
+        self.interval = interval
+        self.lead_seconds = lead_seconds
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.retry_seconds = retry_seconds
+        self._task: asyncio.Task | None = None
+        self._stop_event = asyncio.Event()
+        self._skip_until: Dict[TokenKey, float] = {}
+
+    def start(self):
+        if self.interval <= 0:
+            return
+        if self._task and not self._task.done():
+            return
+        self._stop_event.clear()
+        loop = asyncio.get_running_loop()
+        self._task = loop.create_task(self._run(), name="oauth-token-refresher")
+
+    async def shutdown(self):
+        if not self._task:
+            return
+        self._stop_event.set()
+        try:
+            await self._task
+        finally:
+            self._task = None
+
+    async def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                await self.refresh_due()
+            except Exception as exc:
+                logger.exception("Token refresh pass failed: %s", exc)
+
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                continue
+
+    async def _due_keys(self) -> list[TokenKey]:
+        now = time.monotonic()
+        for key in [key for key, until in self._skip_until.items() if until <= now]:
+            self._skip_until.pop(key, None)
+
+        horizon = datetime.now(timezone.utc) + timedelta(seconds=self.lead_seconds)
+        in_use = exists().where(
+            Workflow.user_id == UserService.user_id,
+            Workflow.active == True,
+            WorkflowStep.workflow_id == Workflow.id,
+            WorkflowStep.service == UserService.service_key,
+        )
+        query = (
+            select(UserService.user_id, UserService.service_key)
+            .where(
+                UserService.token_expires_at.is_not(None),
+                UserService.token_expires_at <= horizon,
+                in_use,
+            )
+            .order_by(UserService.token_expires_at)
+            .limit(self.batch_size + len(self._skip_until))
+        )
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(query)).all()
+        keys = [(user_id, provider) for user_id, provider in rows if (user_id, provider) not in self._skip_until]
+        return keys[:self.batch_size]
+
+    async def refresh_due(self) -> int:
+        keys = await self._due_keys()
+        if not keys:
+            return 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self._refresh(key, semaphore) for key in keys))
+        refreshed = sum(1 for ok in results if ok)
+        logger.info("Refreshed %d of %d expiring OAuth tokens", refreshed, len(keys))
+        return refreshed
+
+    async def _refresh(self, key: TokenKey, semaphore: asyncio.Semaphore) -> bool:
+        user_id, provider = key
+        async with semaphore:
+            try:
+                async with AsyncSessionLocal() as db:
+                    token = await refresh_expiring_token(db, user_id, provider, self.lead_seconds)
+            except Exception as exc:
+                logger.warning("Failed to refresh %s token of user %s: %s", provider, user_id, exc)
+                token = None
+
+        expires_at = (token or {}).get("expires_at")
+        if expires_at and expires_at - time.time() > self.lead_seconds:
+            return True
+        # No refresh token, or the provider refused: leave it to the inline path for a while.
+        self._skip_until[key] = time.monotonic() + self.retry_seconds
+        return False
+
+
+token_refresher = TokenRefresher(
+    interval=settings.TOKEN_REFRESH_INTERVAL,
+    lead_seconds=settings.TOKEN_REFRESH_LEAD_SECONDS,
+    batch_size=settings.TOKEN_REFRESH_BATCH_SIZE,
+    concurrency=settings.TOKEN_REFRESH_CONCURRENCY,
+)
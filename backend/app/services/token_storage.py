@@ -1,10 +1,55 @@
 import json
+from contextvars import ContextVar
 from datetime import datetime, timezone, timedelta
-from typing import Dict, Any
+from typing import Dict, Any, Iterable
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import AsyncSessionLocal
 from app.models.models import UserService
+from app.services.response_cache import AsyncTTLCache
+from app.services.token_cache import MISSING, TokenKey, token_cache
 
-def save_token_to_db(db: Session, user_id: int, provider: str, token: Dict[str, Any]) -> None:
+# Tokens loaded up front for a workflow dispatch, keyed by (user_id, provider).
+# A None value means the user has no token for that provider.
+prefetched_tokens: ContextVar[Dict[TokenKey, Dict[str, Any] | None] | None] = ContextVar("prefetched_tokens", default=None)
+
+# user_id -> frozenset of the service keys the user has linked.
+connected_services_cache = AsyncTTLCache(
+    "connected_services",
+    settings.CONNECTED_SERVICES_CACHE_TTL,
+    max_entries=settings.TOKEN_CACHE_MAX_ENTRIES,
+)
+
+def invalidate_user_services(user_id: int, provider: str | None = None):
+    """Forget cached tokens and linked services after a token is saved or removed."""
+    if provider is None:
+        token_cache.invalidate_user(user_id)
+    else:
+        token_cache.invalidate((user_id, provider))
+    connected_services_cache.invalidate(user_id)
+
+async def get_connected_services(db: Session | AsyncSession, user_id: int) -> frozenset[str]:
+    """Service keys linked by the user, from one query over user_services, cached briefly."""
+    async def load():
+        query = select(UserService.service_key).where(UserService.user_id == user_id)
+        if not isinstance(db, AsyncSession):
+            return frozenset(db.execute(query).scalars().all())
+        # The cache may still be loading after the caller is gone, so it gets a session of its own.
+        async with AsyncSessionLocal() as own_db:
+            result = await own_db.execute(query)
+            return frozenset(result.scalars().all())
+    return await connected_services_cache.get(user_id, load)
+
+def _service_query(user_id: int, provider: str):
+    return select(UserService).where(
+        UserService.user_id == user_id,
+        UserService.service_key == provider
+    )
+
+def _apply_token(service: UserService | None, user_id: int, provider: str, token: Dict[str, Any]) -> UserService | None:
+    """Merge `token` into `service` (keeping the refresh token) and return a new row if there was none."""
     token_payload = dict(token or {})
     expires_at_dt = None
     if 'expires_at' in token_payload:
@@ -12,10 +57,6 @@ def save_token_to_db(db: Session, user_id: int, provider: str, token: Dict[str,
     elif 'expires_in' in token_payload:
         expires_at_dt = datetime.now(timezone.utc) + timedelta(seconds=token_payload['expires_in'])
         token_payload['expires_at'] = int(expires_at_dt.timestamp())
-    service = db.query(UserService).filter(
-        UserService.user_id == user_id,
-        UserService.service_key == provider
-    ).first()
 
     existing_token: Dict[str, Any] | None = None
     if service and service.token_data:
@@ -42,23 +83,43 @@ def save_token_to_db(db: Session, user_id: int, provider: str, token: Dict[str,
         service.token_tag = b''
         service.token_expires_at = expires_at_dt
         service.updated_at = datetime.now(timezone.utc)
-    else:
-        service = UserService(
-            user_id=user_id,
-            service_key=provider,
-            token_data=token_json,
-            token_iv=b'',
-            token_tag=b'',
-            token_expires_at=expires_at_dt
-        )
-        db.add(service)
+        return None
+    return UserService(
+        user_id=user_id,
+        service_key=provider,
+        token_data=token_json,
+        token_iv=b'',
+        token_tag=b'',
+        token_expires_at=expires_at_dt
+    )
+
+def save_token_to_db(db: Session, user_id: int, provider: str, token: Dict[str, Any]) -> None:
+    service = db.execute(_service_query(user_id, provider)).scalars().first()
+    new_service = _apply_token(service, user_id, provider, token)
+    if new_service is not None:
+        db.add(new_service)
     db.commit()
+    invalidate_user_services(user_id, provider)
+
+async def save_token_to_db_async(db: AsyncSession, user_id: int, provider: str, token: Dict[str, Any]) -> None:
+    service = (await db.execute(_service_query(user_id, provider))).scalars().first()
+    new_service = _apply_token(service, user_id, provider, token)
+    if new_service is not None:
+        db.add(new_service)
+    await db.commit()
+    invalidate_user_services(user_id, provider)
 
 def get_token_from_db(db: Session, user_id: int, provider: str) -> Dict[str, Any] | None:
-    service = db.query(UserService).filter(
-        UserService.user_id == user_id,
-        UserService.service_key == provider
-    ).first()
+    service = db.execute(_service_query(user_id, provider)).scalars().first()
+    if not service or not service.token_data:
+        return None
+    try:
+        return json.loads(service.token_data)
+    except Exception:
+        return None
+
+async def get_token_from_db_async(db: AsyncSession, user_id: int, provider: str) -> Dict[str, Any] | None:
+    service = (await db.execute(_service_query(user_id, provider))).scalars().first()
     if not service or not service.token_data:
         return None
     try:
@@ -66,53 +127,130 @@ def get_token_from_db(db: Session, user_id: int, provider: str) -> Dict[str, Any
     except Exception:
         return None
 
+def uses_token(provider: str):
+    """Mark a step handler as reading the user's `provider` token, so dispatch can prefetch it."""
+    def decorate(handler):
+        handler.token_provider = provider
+        return handler
+    return decorate
+
+def token_from_service(service: UserService | None) -> Dict[str, Any] | None:
+    if not service or not service.token_data:
+        return None
+    try:
+        token: Dict[str, Any] = json.loads(service.token_data)
+    except Exception:
+        return None
+    if "expires_at" not in token and service.token_expires_at:
+        token["expires_at"] = int(service.token_expires_at.timestamp())
+    return token
+
+async def prefetch_tokens(db: Session | AsyncSession, keys: Iterable[TokenKey]) -> Dict[TokenKey, Dict[str, Any] | None]:
+    """Load the tokens of many (user_id, provider) pairs, querying the ones not cached in a single query."""
+    tokens: Dict[TokenKey, Dict[str, Any] | None] = {}
+    missing = set()
+    for key in set(keys):
+        cached = token_cache.get(key)
+        if cached is MISSING:
+            missing.add(key)
+        tokens[key] = None if cached is MISSING else cached
+    if not missing:
+        return tokens
+    user_ids = {user_id for user_id, _ in missing}
+    providers = {provider for _, provider in missing}
+    query = select(UserService).where(
+        UserService.user_id.in_(user_ids),
+        UserService.service_key.in_(providers)
+    )
+    result = await db.execute(query) if isinstance(db, AsyncSession) else db.execute(query)
+    for service in result.scalars().all():
+        key = (service.user_id, service.service_key)
+        if key in missing:
+            tokens[key] = token_from_service(service)
+    for key in missing:
+        token_cache.set(key, tokens[key])
+    return tokens
+
 def get_access_token(token_dict: dict) -> str:
     return token_dict.get("access_token")
 
 def get_refresh_token(token_dict: dict) -> str | None:
     return token_dict.get("refresh_token")
 
-def is_token_expired(token_dict: dict) -> bool:
+def is_token_expired(token_dict: dict, margin: float = 0) -> bool:
     expires_at = token_dict.get("expires_at")
     if not expires_at:
         return False
-    return datetime.now(timezone.utc).timestamp() > expires_at
+    return datetime.now(timezone.utc).timestamp() > expires_at - margin
 
 def get_token_scopes(token_dict: dict) -> list[str]:
     scope = token_dict.get("scope", "")
     return scope.split() if scope else []
 
-async def refresh_oauth_token(db: Session, user_id: int, provider: str) -> Dict[str, Any] | None:
+async def _load_token(db: Session | AsyncSession, user_id: int, provider: str, token: Dict[str, Any] | None = None, margin: float = 0) -> Dict[str, Any] | None:
+    """Read the stored token unless given, and exchange its refresh token if it expires within `margin` seconds."""
     from app.routers.oauth import oauth
-    service = db.query(UserService).filter(
-        UserService.user_id == user_id,
-        UserService.service_key == provider
-    ).first()
-    if not service or not service.token_data:
-        return None
-    try:
-        token: Dict[str, Any] = json.loads(service.token_data)
-    except Exception:
-        return None
-    if "expires_at" not in token and service.token_expires_at:
-        token["expires_at"] = int(service.token_expires_at.timestamp())
-    if not is_token_expired(token):
+    if token is None:
+        query = _service_query(user_id, provider)
+        result = await db.execute(query) if isinstance(db, AsyncSession) else db.execute(query)
+        token = token_from_service(result.scalars().first())
+        if token is None:
+            return None
+    if not is_token_expired(token, margin):
         return token
     refresh_token = token.get("refresh_token")
     if not refresh_token:
-        return None
-    try:
-        client = oauth.create_client(provider)
-        new_token = await client.fetch_access_token(
-            grant_type='refresh_token',
-            refresh_token=refresh_token
-        )
-        if not new_token.get("refresh_token"):
-            new_token["refresh_token"] = refresh_token
-        if "expires_at" not in new_token and "expires_in" in new_token:
-            new_token["expires_at"] = int((datetime.now(timezone.utc) + timedelta(seconds=new_token["expires_in"])).timestamp())
+        return token if not is_token_expired(token) else None
+    client = oauth.create_client(provider)
+    new_token = await client.fetch_access_token(
+        grant_type='refresh_token',
+        refresh_token=refresh_token
+    )
+    if not new_token.get("refresh_token"):
+        new_token["refresh_token"] = refresh_token
+    if "expires_at" not in new_token and "expires_in" in new_token:
+        new_token["expires_at"] = int((datetime.now(timezone.utc) + timedelta(seconds=new_token["expires_in"])).timestamp())
+    if isinstance(db, AsyncSession):
+        await save_token_to_db_async(db, user_id, provider, new_token)
+    else:
         save_token_to_db(db, user_id, provider, new_token)
-        return new_token
+    return dict(new_token)
+
+async def _load_token_detached(db: Session | AsyncSession, user_id: int, provider: str, token: Dict[str, Any] | None = None, margin: float = 0) -> Dict[str, Any] | None:
+    """_load_token for token_cache.load, which may outlive the caller: async callers get a session of its own."""
+    if not isinstance(db, AsyncSession):
+        return await _load_token(db, user_id, provider, token, margin)
+    async with AsyncSessionLocal() as own_db:
+        return await _load_token(own_db, user_id, provider, token, margin)
+
+async def refresh_oauth_token(db: Session | AsyncSession, user_id: int, provider: str) -> Dict[str, Any] | None:
+    key = (user_id, provider)
+    tokens = prefetched_tokens.get()
+    token = None
+    if tokens is not None and key in tokens:
+        token = tokens[key]
+        if token is None:
+            return None
+        if not is_token_expired(token):
+            return dict(token)
+    else:
+        cached = token_cache.get(key)
+        if cached is not MISSING:
+            return cached
+    try:
+        # One read or refresh per key at a time; concurrent callers share its result.
+        new_token = await token_cache.load(key, lambda: _load_token_detached(db, user_id, provider, token))
     except Exception as e:
         print(f"Token refresh error: {e}")
         return None
+    if tokens is not None and new_token is not None:
+        tokens[key] = dict(new_token)
+    return new_token
+
+async def refresh_expiring_token(db: AsyncSession, user_id: int, provider: str, lead_seconds: float) -> Dict[str, Any] | None:
+    """Refresh the stored token ahead of time if it expires within `lead_seconds`.
+
+    Goes through the token cache, so a refresh already started by a workflow
+    run for the same key is shared instead of repeated. Errors propagate.
+    """
+    return await token_cache.load((user_id, provider), lambda: _load_token_detached(db, user_id, provider, margin=lead_seconds))
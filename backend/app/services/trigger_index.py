@@ -0,0 +1,162 @@
+import logging
+from typing import Any, Dict, List, NamedTuple, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.models import Workflow, WorkflowStep
+
+logger = logging.getLogger(__name__)
+
+ROUTING_PARAMS: Dict[str, str] = {
+    "discord": "guild_id",
+    "twitch": "username_streamer",
+    "faceit": "player_id",
+}
+
+
+class WorkflowRef(NamedTuple):
+    workflow_id: int
+    user_id: int
+
+
+RouteKey = Tuple[str, str, str | None]
+EventKey = Tuple[str, str]
+
+
+def normalize_routing_key(service: str, value: Any) -> str | None:
+    if value in (None, "", [], {}) or isinstance(value, (dict, list)):
+        return None
+    key = str(value).strip()
+    if service == "twitch":
+        key = key.lower()
+    return key or None
+
+
+def routing_key_for_params(service: str, params: dict | None) -> str | None:
+    field = ROUTING_PARAMS.get(service)
+    if not field or not isinstance(params, dict):
+        return None
+    return normalize_routing_key(service, params.get(field))
+
+
+def routing_key_for_event(service: str, data: dict) -> str | None:
+    return routing_key_for_params(service, data)
+
+
+class TriggerIndex:
+    """In-memory routing table from trigger events to the active workflows listening on them."""
+
+    def __init__(self):
+        self._routes: Dict[RouteKey, Dict[int, WorkflowRef]] = {}
+        self._events: Dict[EventKey, Dict[int, WorkflowRef]] = {}
+        self._workflow_keys: Dict[int, Set[RouteKey]] = {}
+        self._refs: Dict[int, WorkflowRef] = {}
+        self.ready = False
+
+    def rebuild(self, db: Session):
+        rows = (
+            db.query(
+                Workflow.id,
+                Workflow.user_id,
+                WorkflowStep.service,
+                WorkflowStep.event,
+                WorkflowStep.trigger_key,
+            )
+            .join(WorkflowStep, WorkflowStep.workflow_id == Workflow.id)
+            .filter(
+                WorkflowStep.type == "action",
+                Workflow.active == True,
+            )
+            .all()
+        )
+
+        self._routes.clear()
+        self._events.clear()
+        self._workflow_keys.clear()
+        self._refs.clear()
+        for workflow_id, user_id, service, event, trigger_key in rows:
+            self._add_route(WorkflowRef(workflow_id, user_id), (service, event, trigger_key))
+        self.ready = True
+        logger.info("Trigger index built: %d workflows, %d routes", len(self._refs), len(self._routes))
+
+    def update_workflow(self, workflow: Workflow):
+        self.remove_workflow(workflow.id)
+        if not workflow.active:
+            return
+        ref = WorkflowRef(workflow.id, workflow.user_id)
+        for step in workflow.steps:
+            if step.type != "action":
+                continue
+            self._add_route(ref, (step.service, step.event, step.trigger_key))
+
+    def remove_workflow(self, workflow_id: int):
+        self._refs.pop(workflow_id, None)
+        for route in self._workflow_keys.pop(workflow_id, set()):
+            self._discard(self._routes, route, workflow_id)
+            self._discard(self._events, route[:2], workflow_id)
+
+    def resolve(self, service: str, event_type: str, data: dict) -> List[WorkflowRef]:
+        if service == "timer":
+            refs = self._events.get((service, event_type), {})
+            workflow_id = data.get("workflow_id")
+            if workflow_id:
+                ref = refs.get(int(workflow_id))
+                return [ref] if ref else []
+            return sorted(refs.values())
+
+        field = ROUTING_PARAMS.get(service)
+        if field and field in data:
+            refs = self._routes.get((service, event_type, routing_key_for_event(service, data)), {})
+        else:
+            refs = self._events.get((service, event_type), {})
+        return sorted(refs.values())
+
+    def _add_route(self, ref: WorkflowRef, route: RouteKey):
+        self._refs[ref.workflow_id] = ref
+        self._workflow_keys.setdefault(ref.workflow_id, set()).add(route)
+        self._routes.setdefault(route, {})[ref.workflow_id] = ref
+        self._events.setdefault(route[:2], {})[ref.workflow_id] = ref
+
+    @staticmethod
+    def _discard(table: Dict[Any, Dict[int, WorkflowRef]], key, workflow_id: int):
+        refs = table.get(key)
+        if refs is None:
+            return
+        refs.pop(workflow_id, None)
+        if not refs:
+            table.pop(key, None)
+
+
+async def find_trigger_refs(db: AsyncSession, service: str, event_type: str, data: dict) -> List[WorkflowRef]:
+    """Database equivalent of TriggerIndex.resolve, served by idx_steps_routing."""
+    filter_conditions = [
+        WorkflowStep.type == "action",
+        WorkflowStep.service == service,
+        WorkflowStep.event == event_type,
+        Workflow.active == True,
+    ]
+
+    field = ROUTING_PARAMS.get(service)
+    if field and field in data:
+        filter_conditions.append(WorkflowStep.trigger_key == routing_key_for_event(service, data))
+    elif service == "timer":
+        step_id = data.get("step_id")
+        workflow_id = data.get("workflow_id")
+        if step_id:
+            filter_conditions.append(WorkflowStep.id == step_id)
+        if workflow_id:
+            filter_conditions.append(WorkflowStep.workflow_id == workflow_id)
+
+    rows = await db.execute(
+        select(Workflow.id, Workflow.user_id)
+        .join(WorkflowStep, WorkflowStep.workflow_id == Workflow.id)
+        .where(*filter_conditions)
+        .distinct()
+        .order_by(Workflow.id)
+    )
+    return [WorkflowRef(workflow_id, user_id) for workflow_id, user_id in rows]
+
+
+trigger_index = TriggerIndex()
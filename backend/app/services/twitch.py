@@ -1,39 +1,101 @@
+import asyncio
+import time
+from collections import defaultdict
+from typing import Dict, Tuple
 import httpx
-from sqlalchemy.orm import Session
+from app.services.http_clients import http_clients
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.config import settings
-from app.services.token_storage import refresh_oauth_token
+from app.database import AsyncSessionLocal
+from app.models.models import TwitchSubscription
 from fastapi import HTTPException
 
-async def get_app_access_token() -> str:
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://id.twitch.tv/oauth2/token",
-            params={
-                "client_id": settings.TWITCH_CLIENT_ID,
-                "client_secret": settings.TWITCH_CLIENT_SECRET,
-                "grant_type": "client_credentials"
-            }
-        )
+TWITCH_CALLBACK_URL = "https://trigger.ink/actions/twitch"
+TWITCH_SUBSCRIPTIONS_URL = "https://api.twitch.tv/helix/eventsub/subscriptions"
+
+# Subscriptions Twitch keeps (or is still verifying) and that can be reused for new workflows.
+ACTIVE_SUBSCRIPTION_STATUSES = ("enabled", "webhook_callback_verification_pending")
+
+class AppTokenCache:
+    """Twitch app access token shared by all callers until shortly before it expires.
+
+    Concurrent callers wait on the same token request; a 401 from Twitch
+    invalidates the cached token so the next call fetches a new one.
+    """
+
+    def __init__(self, refresh_margin: float = 300.0):
+        self.refresh_margin = refresh_margin
+        self._token: str | None = None
+        self._expires_at = 0.0
+        self._pending: asyncio.Task | None = None
+
+    async def get(self) -> str:
+        if self._token and time.monotonic() < self._expires_at:
+            return self._token
+        if self._pending is None:
+            # The request runs in its own task so that a cancelled caller does not strand the others.
+            self._pending = asyncio.get_running_loop().create_task(self._fetch())
+            self._pending.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return await asyncio.shield(self._pending)
+
+    async def _fetch(self) -> str:
+        try:
+            token, expires_in = await request_app_access_token()
+            self._token = token
+            self._expires_at = time.monotonic() + max(0.0, expires_in - self.refresh_margin)
+            return token
+        finally:
+            self._pending = None
+
+    def invalidate(self, token: str | None = None):
+        if token is None or token == self._token:
+            self._token = None
+            self._expires_at = 0.0
+
+
+async def request_app_access_token() -> tuple[str, float]:
+    client = http_clients.get("twitch")
+    response = await client.post(
+        "https://id.twitch.tv/oauth2/token",
+        params={
+            "client_id": settings.TWITCH_CLIENT_ID,
+            "client_secret": settings.TWITCH_CLIENT_SECRET,
+            "grant_type": "client_credentials"
+        }
+    )
     if response.status_code != 200:
         raise Exception(f"Failed to get app access token: {response.text}")
     data = response.json()
-    return data["access_token"]
+    return data["access_token"], float(data.get("expires_in") or 0)
 
-async def get_twitch_user_id(username_streamer: str) -> str:
-    token = await get_app_access_token()
-    if not token:
-        raise HTTPException(status_code=401, detail="User not connected to Twitch")
+app_token_cache = AppTokenCache()
 
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Client-Id": settings.TWITCH_CLIENT_ID
-    }
+async def get_app_access_token() -> str:
+    return await app_token_cache.get()
+
+async def twitch_app_request(method: str, url: str, **kwargs) -> httpx.Response:
+    """Call the Helix API with the app token, fetching a new token once if Twitch rejects it."""
+    client = http_clients.get("twitch")
+    extra_headers = kwargs.pop("headers", {})
+    for attempt in range(2):
+        token = await get_app_access_token()
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Client-Id": settings.TWITCH_CLIENT_ID,
+            **extra_headers
+        }
+        response = await client.request(method, url, headers=headers, **kwargs)
+        if response.status_code != 401 or attempt:
+            return response
+        app_token_cache.invalidate(token)
+    return response
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"https://api.twitch.tv/helix/users?login={username_streamer}",
-            headers=headers
-        )
+async def get_twitch_user_id(username_streamer: str) -> str:
+    response = await twitch_app_request(
+        "GET",
+        f"https://api.twitch.tv/helix/users?login={username_streamer}"
+    )
     if response.status_code != 200:
         raise HTTPException(status_code=500, detail=f"Twitch API error: {response.text}")
 
@@ -44,18 +106,61 @@ async def get_twitch_user_id(username_streamer: str) -> str:
     user = data["data"][0]
     return user["id"]
 
-async def create_twitch_webhook(event_type: str, broadcaster_id: str, db: Session, user_id: int) -> str:
-    if event_type:
-        token = await get_app_access_token()
-    if not token:
-        raise HTTPException(status_code=401, detail="User not connected to Twitch")
+async def find_twitch_subscription(db: AsyncSession, event_type: str, broadcaster_id: str) -> TwitchSubscription | None:
+    result = await db.execute(select(TwitchSubscription).where(
+        TwitchSubscription.type == event_type,
+        TwitchSubscription.broadcaster_id == broadcaster_id,
+        TwitchSubscription.callback == TWITCH_CALLBACK_URL,
+    ))
+    return result.scalars().first()
 
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Client-Id": settings.TWITCH_CLIENT_ID,
-        "Content-Type": "application/json"
-    }
+async def record_twitch_subscription(db: AsyncSession, subscription: dict) -> TwitchSubscription:
+    """Mirror a subscription object returned by Helix; the caller commits."""
+    event_type = subscription["type"]
+    broadcaster_id = subscription.get("condition", {}).get("broadcaster_user_id")
+    callback = subscription.get("transport", {}).get("callback") or TWITCH_CALLBACK_URL
+    result = await db.execute(select(TwitchSubscription).where(
+        TwitchSubscription.type == event_type,
+        TwitchSubscription.broadcaster_id == broadcaster_id,
+        TwitchSubscription.callback == callback,
+        TwitchSubscription.id != subscription["id"],
+    ))
+    stale = result.scalars().first()
+    if stale:
+        await db.delete(stale)
+        await db.flush()
+    return await db.merge(TwitchSubscription(
+        id=subscription["id"],
+        type=event_type,
+        broadcaster_id=broadcaster_id,
+        callback=callback,
+        status=subscription.get("status") or "enabled",
+    ))
 
+async def forget_twitch_subscription(db: AsyncSession, webhook_id: str):
+    await db.execute(
+        delete(TwitchSubscription)
+        .where(TwitchSubscription.id == webhook_id)
+        .execution_options(synchronize_session=False)
+    )
+
+async def fetch_twitch_subscriptions(**params) -> list[dict]:
+    """Every EventSub subscription matching `params`, following the pagination cursor."""
+    subscriptions = []
+    cursor = None
+    while True:
+        page_params = dict(params, after=cursor) if cursor else params
+        response = await twitch_app_request("GET", TWITCH_SUBSCRIPTIONS_URL, params=page_params)
+        if response.status_code != 200:
+            raise HTTPException(status_code=500, detail=f"Failed to list webhooks: {response.text}")
+        body = response.json()
+        subscriptions.extend(body.get("data", []))
+        cursor = body.get("pagination", {}).get("cursor")
+        if not cursor:
+            return subscriptions
+
+async def create_twitch_webhook(event_type: str, broadcaster_id: str) -> dict:
+    """Create the subscription on Twitch (or adopt an existing one) and return its Helix object; the caller records it."""
     subscription_data = {
         "type": event_type,
         "version": "2" if event_type == "channel.follow" else "1",
@@ -64,52 +169,100 @@ async def create_twitch_webhook(event_type: str, broadcaster_id: str, db: Sessio
         },
         "transport": {
             "method": "webhook",
-            "callback": "https://trigger.ink/actions/twitch",
+            "callback": TWITCH_CALLBACK_URL,
             "secret": settings.TWITCH_WEBHOOK_SECRET
         }
     }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://api.twitch.tv/helix/eventsub/subscriptions",
-            headers=headers,
-            json=subscription_data
-        )
+    response = await twitch_app_request(
+        "POST",
+        TWITCH_SUBSCRIPTIONS_URL,
+        headers={"Content-Type": "application/json"},
+        json=subscription_data
+    )
 
     if response.status_code == 202:
         data = response.json().get("data", [])
         if not data:
             raise HTTPException(status_code=500, detail="Empty response from Twitch.")
-        return data[0]["id"]
-    else:
-        error_detail = response.json() if response.text else response.text
-        raise HTTPException(
-            status_code=response.status_code,
-            detail=f"Failed to create webhook: {error_detail}"
-        )
-
-async def delete_twitch_webhook(db: Session, user_id: int, webhook_id: str, event_type: str):
-    if event_type == "stream.online":
-        token = await get_app_access_token()
-    else:
-        token = await refresh_oauth_token(db, user_id, "twitch")
-        if not token:
-            raise HTTPException(status_code=401, detail="User not connected to Twitch")
-
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Client-Id": settings.TWITCH_CLIENT_ID
-    }
+        return data[0]
+    elif response.status_code == 409:
+        # Created earlier but missing from the local table: adopt it instead of failing.
+        for subscription in await fetch_twitch_subscriptions(user_id=broadcaster_id):
+            if (
+                subscription.get("type") == event_type
+                and subscription.get("condition", {}).get("broadcaster_user_id") == broadcaster_id
+                and subscription.get("transport", {}).get("callback") == TWITCH_CALLBACK_URL
+            ):
+                return subscription
 
-    async with httpx.AsyncClient() as client:
-        response = await client.delete(
-            f"https://api.twitch.tv/helix/eventsub/subscriptions?id={webhook_id}",
-            headers=headers
-        )
+    error_detail = response.json() if response.text else response.text
+    raise HTTPException(
+        status_code=response.status_code,
+        detail=f"Failed to create webhook: {error_detail}"
+    )
 
-    if response.status_code != 204:
+async def delete_twitch_webhook(webhook_id: str):
+    # Webhook subscriptions belong to the app, so they are always deleted with the app token.
+    response = await twitch_app_request("DELETE", TWITCH_SUBSCRIPTIONS_URL, params={"id": webhook_id})
+    if response.status_code not in (204, 404):
         raise HTTPException(status_code=500, detail=f"Failed to delete webhook: {response.text}")
 
+# Serialises acquire/release of one (event type, broadcaster) subscription within this process.
+subscription_locks: Dict[Tuple[str, str], asyncio.Lock] = defaultdict(asyncio.Lock)
+
+async def acquire_twitch_subscription(event_type: str, broadcaster_id: str) -> str:
+    """Id of the subscription for (event_type, broadcaster_id), creating it on Twitch only for the first user.
+
+    The reference is committed in its own session right away so that concurrent
+    workflow saves see it; references left by a save that rolls back are
+    corrected by the reconcile job.
+    """
+    async with subscription_locks[(event_type, broadcaster_id)]:
+        # No session is held while Twitch is called.
+        async with AsyncSessionLocal() as db:
+            subscription = await find_twitch_subscription(db, event_type, broadcaster_id)
+            webhook_id = subscription.id if subscription and subscription.status in ACTIVE_SUBSCRIPTION_STATUSES else None
+        created = None if webhook_id else await create_twitch_webhook(event_type, broadcaster_id)
+        async with AsyncSessionLocal() as db:
+            if created is not None:
+                webhook_id = (await record_twitch_subscription(db, created)).id
+                await db.flush()
+            await db.execute(
+                update(TwitchSubscription)
+                .where(TwitchSubscription.id == webhook_id)
+                .values(ref_count=TwitchSubscription.ref_count + 1)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        return webhook_id
+
+async def release_twitch_subscription(webhook_id: str):
+    """Drop one reference; the subscription is deleted on Twitch once no workflow step uses it."""
+    async with AsyncSessionLocal() as db:
+        subscription = await db.get(TwitchSubscription, webhook_id)
+        if subscription is None:
+            # Not mirrored yet: the reconcile job counts its references and prunes it if unused.
+            return
+        key = (subscription.type, subscription.broadcaster_id)
+
+    async with subscription_locks[key]:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(TwitchSubscription)
+                .where(TwitchSubscription.id == webhook_id, TwitchSubscription.ref_count > 0)
+                .values(ref_count=TwitchSubscription.ref_count - 1)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            subscription = await db.get(TwitchSubscription, webhook_id)
+            if subscription is None or subscription.ref_count > 0:
+                return
+        await delete_twitch_webhook(webhook_id)
+        async with AsyncSessionLocal() as db:
+            await forget_twitch_subscription(db, webhook_id)
+            await db.commit()
+
 def parse_twitch_event(event_type: str, event_data: dict):
     payload = None
 
@@ -117,6 +270,7 @@ def parse_twitch_event(event_type: str, event_data: dict):
         payload = {
             "event": "stream.online",
             "broadcaster_user_id": event_data.get("broadcaster_user_id"),
+            "username_streamer": event_data.get("broadcaster_user_login"),
             "broadcaster_user_name": event_data.get("broadcaster_user_name"),
             "message": f"{event_data.get('broadcaster_user_name')} is now live!"
         }
@@ -124,6 +278,7 @@ def parse_twitch_event(event_type: str, event_data: dict):
         payload = {
             "event": "channel.follow",
             "broadcaster_user_id": event_data.get("broadcaster_user_id"),
+            "username_streamer": event_data.get("broadcaster_user_login"),
             "follower_name": event_data.get("user_name"),
             "message": f"{event_data.get('user_name')} just followed {event_data.get('broadcaster_user_name')}!"
         }
@@ -131,31 +286,9 @@ def parse_twitch_event(event_type: str, event_data: dict):
         payload = {
             "event": "channel.subscriber",
             "broadcaster_user_id": event_data.get("broadcaster_user_id"),
+            "username_streamer": event_data.get("broadcaster_user_login"),
             "subscriber_name": event_data.get("user_name"),
             "tier": event_data.get("tier", "1000"),
             "message": f"{event_data.get('user_name')} just subscribed to {event_data.get('broadcaster_user_name')}!"
         }
     return payload
-
-async def get_existing_twitch_webhook_id(event_type: str, broadcaster_id: str) -> str | None:
-    headers = {
-        "Authorization": f"Bearer {await get_app_access_token()}",
-        "Client-Id": settings.TWITCH_CLIENT_ID
-    }
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(
-            "https://api.twitch.tv/helix/eventsub/subscriptions",
-            headers=headers
-        )
-    if resp.status_code != 200:
-        return None
-    for sub in resp.json().get("data", []):
-        cond = sub.get("condition", {})
-        if (
-            sub.get("type") == event_type
-            and cond.get("broadcaster_user_id") == broadcaster_id
-            and sub.get("transport", {}).get("callback") == "https://trigger.ink/actions/twitch"
-            and sub.get("status") == "enabled"
-        ):
-            return sub["id"]
-    return None
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.models import TwitchSubscription, WorkflowStep
+from app.services.twitch import TWITCH_CALLBACK_URL, delete_twitch_webhook, fetch_twitch_subscriptions, subscription_locks
+
+logger = logging.getLogger(__name__)
+
+# Rows touched this recently may belong to a workflow save that has not committed its steps yet.
+REF_COUNT_GRACE = timedelta(minutes=10)
+
+
+class TwitchSubscriptionReconciler:
+    """Periodically brings twitch_subscriptions in line with what Twitch reports.
+
+    Our own create/delete calls keep the table current; this job catches
+    subscriptions Twitch revoked or that were changed outside the backend,
+    recounts the workflow steps using each one and deletes those left unused.
+    """
+
+    def __init__(self, interval: int = 3600):
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+        self._stop_event = asyncio.Event()
+
+    def start(self):
+        if self.interval <= 0 or not settings.TWITCH_CLIENT_ID:
+            return
+        if self._task and not self._task.done():
+            return
+        self._stop_event.clear()
+        loop = asyncio.get_running_loop()
+        self._task = loop.create_task(self._run(), name="twitch-subscription-reconcile")
+
+    async def shutdown(self):
+        if not self._task:
+            return
+        self._stop_event.set()
+        try:
+            await self._task
+        finally:
+            self._task = None
+
+    async def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                await self.reconcile()
+            except Exception as exc:
+                logger.exception("Twitch subscription reconcile failed: %s", exc)
+
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                continue
+
+    async def reconcile(self):
+        started_at = datetime.now(timezone.utc)
+        settled_before = started_at - REF_COUNT_GRACE
+        remote = {
+            subscription["id"]: subscription
+            for subscription in await fetch_twitch_subscriptions()
+            if subscription.get("transport", {}).get("callback") == TWITCH_CALLBACK_URL
+        }
+
+        async with AsyncSessionLocal() as db:
+            local = {
+                row.id: row
+                for row in (await db.execute(
+                    select(TwitchSubscription).where(TwitchSubscription.callback == TWITCH_CALLBACK_URL)
+                )).scalars()
+            }
+            refs = await self._count_refs(db)
+
+            # Rows written after the listing started may not be in it yet; keep them.
+            missing = [
+                sub_id for sub_id, row in local.items()
+                if sub_id not in remote and not self._recent(row, started_at)
+            ]
+            if missing:
+                await db.execute(delete(TwitchSubscription).where(TwitchSubscription.id.in_(missing)))
+            kept = {
+                (row.type, row.broadcaster_id)
+                for sub_id, row in local.items()
+                if sub_id not in missing
+            }
+
+            added = 0
+            for sub_id, subscription in remote.items():
+                status = subscription.get("status") or "enabled"
+                row = local.get(sub_id)
+                if row is not None:
+                    if row.status != status:
+                        row.status = status
+                    if not self._recent(row, settled_before):
+                        row.ref_count = refs[sub_id]
+                    continue
+                key = (subscription["type"], subscription.get("condition", {}).get("broadcaster_user_id"))
+                if key in kept:
+                    continue
+                db.add(TwitchSubscription(
+                    id=sub_id,
+                    type=key[0],
+                    broadcaster_id=key[1],
+                    callback=TWITCH_CALLBACK_URL,
+                    status=status,
+                    ref_count=refs[sub_id],
+                ))
+                kept.add(key)
+                added += 1
+            unused = [
+                (row.id, row.type, row.broadcaster_id)
+                for sub_id, row in local.items()
+                if sub_id in remote and row.ref_count == 0 and not self._recent(row, settled_before)
+            ]
+            await db.commit()
+
+            pruned = 0
+            for sub_id, event_type, broadcaster_id in unused:
+                if await self._prune(db, sub_id, (event_type, broadcaster_id), settled_before):
+                    pruned += 1
+
+        if missing or added or pruned:
+            logger.info(
+                "Reconciled Twitch subscriptions: %d remote, %d added, %d removed, %d unused deleted",
+                len(remote), added, len(missing), pruned,
+            )
+
+    @staticmethod
+    def _recent(row: TwitchSubscription, cutoff: datetime) -> bool:
+        return row.updated_at is not None and row.updated_at.replace(tzinfo=timezone.utc) >= cutoff
+
+    @staticmethod
+    async def _count_refs(db) -> Counter:
+        result = await db.execute(
+            select(WorkflowStep.params).where(WorkflowStep.type == "action", WorkflowStep.service == "twitch")
+        )
+        return Counter(
+            params["webhook_id"]
+            for params in result.scalars()
+            if isinstance(params, dict) and params.get("webhook_id")
+        )
+
+    async def _prune(self, db, sub_id: str, key: tuple, settled_before: datetime) -> bool:
+        async with subscription_locks[key]:
+            result = await db.execute(
+                delete(TwitchSubscription).where(
+                    TwitchSubscription.id == sub_id,
+                    TwitchSubscription.ref_count == 0,
+                    TwitchSubscription.updated_at < settled_before,
+                ).execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            if not result.rowcount:
+                return False
+            # If this fails the next run finds the subscription again and retries.
+            await delete_twitch_webhook(sub_id)
+            return True
+
+
+twitch_reconciler = TwitchSubscriptionReconciler(interval=settings.TWITCH_RECONCILE_INTERVAL)
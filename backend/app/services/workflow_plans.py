@@ -0,0 +1,224 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Set, Tuple
+
+from app.routers.catalog import ACTIONS_CATALOG
+from app.services.actions import ACTION_DISPATCH
+from app.services.reactions import REACTION_DISPATCH
+
+TRIGGER_EVENTS = {
+    (meta["service"], meta["event"])
+    for meta in ACTIONS_CATALOG.values()
+    if meta.get("action_kind") == "trigger"
+}
+
+PathPart = Tuple[str, int | None]
+Handler = Callable[..., Awaitable[Any]]
+
+
+class WorkflowPlanError(ValueError):
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def parse_path(path: Any) -> Tuple[PathPart, ...]:
+    if path in (None, "", "."):
+        return ()
+    parts: List[PathPart] = []
+    for part in str(path).split("."):
+        try:
+            idx = int(part)
+        except (TypeError, ValueError):
+            idx = None
+        parts.append((part, idx))
+    return tuple(parts)
+
+
+def value_at(payload: Any, accessors: Tuple[PathPart, ...]):
+    if payload is None:
+        return None
+
+    current = payload
+    for key, idx in accessors:
+        if isinstance(current, list):
+            if idx is None or idx < 0 or idx >= len(current):
+                return None
+            current = current[idx]
+        elif isinstance(current, dict):
+            current = current.get(key)
+        else:
+            return None
+
+        if current is None:
+            return None
+    return current
+
+
+def value_from_path(payload: Any, path: str):
+    return value_at(payload, parse_path(path))
+
+
+class ParamLink(NamedTuple):
+    source_step: Any
+    accessors: Tuple[PathPart, ...]
+    fallback: Any
+
+
+class CompiledStep(NamedTuple):
+    step_order: int
+    type: str
+    service: str
+    event: str
+    handler: Handler | None
+    static_params: Dict[str, Any]
+    links: Tuple[Tuple[str, ParamLink], ...]
+    dependencies: Tuple[int, ...]
+    token_provider: str | None = None
+
+    @property
+    def label(self) -> str:
+        return f"{self.service}.{self.event}"
+
+    def resolve_params(self, context: Dict[Any, Any], trigger_data: dict) -> dict:
+        params = dict(self.static_params)
+        for name, link in self.links:
+            payload = context.get(link.source_step)
+            resolved = value_at(payload, link.accessors) if payload is not None else None
+            params[name] = link.fallback if resolved in (None, "", [], {}) else resolved
+
+        if self.type == "reaction":
+            incoming_message = trigger_data.get("message")
+            if incoming_message and params.get("message") in (None, "", {}, []):
+                params["message"] = incoming_message
+        return params
+
+
+class WorkflowPlan(NamedTuple):
+    workflow_id: int | None
+    updated_at: datetime | None
+    steps: Tuple[CompiledStep, ...]
+    actions_by_event: Dict[Tuple[str, str], Tuple[int, ...]]
+    errors: Tuple[str, ...]
+
+    def trigger_orders(self, service: str, event_type: str) -> Tuple[int, ...]:
+        return self.actions_by_event.get((service, event_type), ())
+
+    def token_providers(self, service: str, event_type: str) -> Set[str]:
+        """Providers whose tokens the steps run for this trigger will read."""
+        trigger_orders = self.trigger_orders(service, event_type)
+        return {
+            step.token_provider for step in self.steps
+            if step.token_provider and step.step_order not in trigger_orders
+        }
+
+
+def compile_plan(steps: Iterable[Any], workflow_id: int | None = None, updated_at: datetime | None = None) -> WorkflowPlan:
+    """Pre-order steps, pre-resolve handlers and pre-parse link paths.
+
+    Problems are collected in `errors` rather than raised so that plans for
+    workflows saved before validation existed still run as they used to.
+    """
+    ordered = sorted(steps, key=lambda s: s.step_order)
+    types_by_order = {step.step_order: step.type for step in ordered}
+    getter_orders = {
+        step.step_order for step in ordered
+        if step.type == "action" and (step.service, step.event) not in TRIGGER_EVENTS
+    }
+    errors: List[str] = []
+    compiled: List[CompiledStep] = []
+    actions_by_event: Dict[Tuple[str, str], List[int]] = {}
+
+    for step in ordered:
+        if step.type not in ("action", "reaction"):
+            continue
+        label = f"{step.service}.{step.event}"
+        if step.type == "action":
+            actions_by_event.setdefault((step.service, step.event), []).append(step.step_order)
+            handler = ACTION_DISPATCH.get((step.service, step.event))
+            if handler is None and (step.service, step.event) not in TRIGGER_EVENTS:
+                errors.append(f"Step {step.step_order} ({label}): No action for {step.service}:{step.event}")
+        else:
+            handler = REACTION_DISPATCH.get((step.service, step.event))
+            if handler is None:
+                errors.append(f"Step {step.step_order} ({label}): No reaction for {step.service}:{step.event}")
+
+        static_params: Dict[str, Any] = {}
+        links: List[Tuple[str, ParamLink]] = []
+        dependencies = set()
+        for name, value in (step.params or {}).items():
+            if not (isinstance(value, dict) and "__link" in value):
+                static_params[name] = value
+                continue
+
+            static_params[name] = None
+            link_data = value.get("__link") or {}
+            source_step = link_data.get("source_step")
+            links.append((name, ParamLink(source_step, parse_path(link_data.get("path")), link_data.get("fallback"))))
+
+            source_type = types_by_order.get(source_step)
+            if source_type is None or source_step == step.step_order:
+                errors.append(f"Step {step.step_order} ({label}): param '{name}' links to unknown step {source_step}")
+            elif source_type != "action":
+                errors.append(f"Step {step.step_order} ({label}): param '{name}' links to step {source_step}, which has no output")
+            elif step.type == "reaction" or source_step < step.step_order:
+                dependencies.add(source_step)
+            elif source_step in getter_orders:
+                errors.append(f"Step {step.step_order} ({label}): param '{name}' links to later action step {source_step}")
+
+        compiled.append(CompiledStep(
+            step_order=step.step_order,
+            type=step.type,
+            service=step.service,
+            event=step.event,
+            handler=handler,
+            static_params=static_params,
+            links=tuple(links),
+            dependencies=tuple(sorted(dependencies)),
+            token_provider=getattr(handler, "token_provider", None),
+        ))
+
+    return WorkflowPlan(
+        workflow_id=workflow_id,
+        updated_at=updated_at,
+        steps=tuple(compiled),
+        actions_by_event={key: tuple(orders) for key, orders in actions_by_event.items()},
+        errors=tuple(errors),
+    )
+
+
+def validate_steps(steps: Iterable[Any]) -> WorkflowPlan:
+    plan = compile_plan(steps)
+    if plan.errors:
+        raise WorkflowPlanError(list(plan.errors))
+    return plan
+
+
+class PlanCache:
+    """LRU cache of compiled plans keyed by workflow id and checked against updated_at."""
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._plans: "OrderedDict[int, WorkflowPlan]" = OrderedDict()
+
+    def get(self, workflow) -> WorkflowPlan:
+        plan = self._plans.get(workflow.id)
+        if plan is not None and plan.updated_at == workflow.updated_at:
+            self._plans.move_to_end(workflow.id)
+            return plan
+
+        plan = compile_plan(workflow.steps, workflow.id, workflow.updated_at)
+        self._plans[workflow.id] = plan
+        self._plans.move_to_end(workflow.id)
+        while len(self._plans) > self.max_size:
+            self._plans.popitem(last=False)
+        return plan
+
+    def evict(self, workflow_id: int):
+        self._plans.pop(workflow_id, None)
+
+    def clear(self):
+        self._plans.clear()
+
+
+plan_cache = PlanCache()
@@ -1,166 +1,212 @@
+import asyncio
+import logging
+import time
 from copy import deepcopy
+from datetime import datetime, timezone
 from typing import Any, Dict
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from app.config import settings
+from app.database import AsyncSessionLocal
 from app.models.models import Workflow, WorkflowStep
-from app.services.reactions import execute_reaction
-from app.services.actions import execute_action
-from app.services.twitch import get_existing_twitch_webhook_id, get_twitch_user_id, create_twitch_webhook, delete_twitch_webhook
+from app.services.trigger_index import trigger_index, find_trigger_refs, routing_key_for_params
+from app.services.circuit_breakers import provider_guards
+from app.services.concurrency import KeyedConcurrencyLimiter
+from app.services.run_history import run_history
+from app.services.timer_scheduler import scheduler as timer_scheduler
+from app.services.token_storage import TokenKey, prefetch_tokens, prefetched_tokens
+from app.services.workflow_plans import CompiledStep, WorkflowPlan, WorkflowPlanError, plan_cache, validate_steps
+from app.services.twitch import acquire_twitch_subscription, get_twitch_user_id, release_twitch_subscription
 from fastapi import HTTPException
 
-def value_from_path(payload: Any, path: str):
-    if payload is None:
-        return None
-    if path in (None, "", "."):
-        return payload
-
-    current = payload
-    for part in path.split("."):
-        if isinstance(current, list):
-            try:
-                idx = int(part)
-            except (TypeError, ValueError):
-                return None
-            if idx < 0 or idx >= len(current):
-                return None
-            current = current[idx]
-        elif isinstance(current, dict):
-            current = current.get(part)
-        else:
-            return None
-
-        if current is None:
-            return None
-    return current
-
-
-def resolve_param_value(value: Any, context: Dict[Any, Any]):
-    if isinstance(value, dict) and "__link" in value:
-        link_data = value.get("__link") or {}
-        source_step = link_data.get("source_step")
-        path = link_data.get("path")
-        fallback = link_data.get("fallback")
-
-        payload = context.get(source_step)
-        resolved = value_from_path(payload, path) if payload is not None else None
-        if resolved in (None, "", [], {}):
-            return fallback
-        return resolved
-    return value
-
-
-def prepare_step_params(raw_params: dict | None, context: Dict[Any, Any], trigger_data: dict, include_message_fallback: bool = False):
-    params: Dict[str, Any] = {}
-    for key, value in (raw_params or {}).items():
-        params[key] = resolve_param_value(value, context)
-
-    if include_message_fallback:
-        incoming_message = trigger_data.get("message")
-        if incoming_message and params.get("message") in (None, "", {}, []):
-            params["message"] = incoming_message
-
-    return params
-
-
-async def trigger_workflows(service: str, event_type: str, data: dict, db: Session):
-    filter_conditions = [
-        WorkflowStep.event == event_type,
-        WorkflowStep.service == service,
-        WorkflowStep.type == "action",
-        Workflow.active == True
+logger = logging.getLogger(__name__)
+
+workflow_limiter = KeyedConcurrencyLimiter(
+    settings.WORKFLOW_MAX_CONCURRENCY,
+    settings.WORKFLOW_MAX_CONCURRENCY_PER_USER,
+)
+
+
+async def run_step(step: CompiledStep, db: Session | AsyncSession, user_id: int, params: dict):
+    try:
+        if step.handler is None:
+            raise NotImplementedError(f"No {step.type} for {step.service}:{step.event}")
+        output = await provider_guards.call(step.service, step.handler, db, user_id, params)
+        return output, {
+            "success": True,
+            "step": step.label,
+            "result": output
+        }
+    except NotImplementedError as exc:
+        return None, {
+            "success": False,
+            "step": step.label,
+            "error": f"Not implemented: {exc}"
+        }
+    except Exception as exc:
+        return None, {
+            "success": False,
+            "step": step.label,
+            "error": str(exc)
+        }
+
+
+async def execute_plan(plan: WorkflowPlan, user_id: int, service: str, event_type: str, data: dict, step_runs: list | None = None, tokens: Dict[TokenKey, Any] | None = None, completed: set[int] | None = None):
+    """Run a compiled workflow plan as a dependency graph built from its __link params.
+
+    Steps start as soon as the actions they link to have finished, so independent
+    actions and reactions run concurrently. Results keep the sequential layout:
+    actions first, then reactions, each in step order. Handlers read `tokens`
+    through refresh_oauth_token instead of querying user_services.
+
+    An AsyncSession does not allow concurrent operations, so every step gets
+    its own session; it only checks out a connection if the step needs one.
+
+    Reactions whose step_order is in `completed` are skipped, and reactions
+    that succeed are added to it, so a retried event does not repeat them.
+    Actions always run since reactions may link to their output.
+    """
+    trigger_orders = plan.trigger_orders(service, event_type)
+    context: Dict[Any, Any] = {"trigger": data}
+    for order in trigger_orders:
+        context[order] = data
+
+    runnable = [
+        step for step in plan.steps
+        if step.step_order not in trigger_orders
+        and not (completed is not None and step.type == "reaction" and step.step_order in completed)
     ]
-
-    if service == "discord" and "guild_id" in data:
-        filter_conditions.append(
-            func.JSON_EXTRACT(WorkflowStep.params, '$.guild_id') == data["guild_id"]
-        )
-    elif service == "twitch" and "username_streamer" in data:
-        filter_conditions.append(
-            func.JSON_EXTRACT(WorkflowStep.params, '$.username_streamer') == data["username_streamer"]
-        )
-    elif service == "faceit" and "player_id" in data:
-        filter_conditions.append(
-            func.JSON_EXTRACT(WorkflowStep.params, '$.player_id') == data["player_id"]
-        )
-    elif service == "timer":
-        step_id = data.get("step_id")
-        workflow_id = data.get("workflow_id")
-        if step_id:
-            filter_conditions.append(WorkflowStep.id == step_id)
-        if workflow_id:
-            filter_conditions.append(WorkflowStep.workflow_id == workflow_id)
-
-
-    query = db.query(Workflow).join(WorkflowStep).filter(*filter_conditions)
-    workflows = query.all()
-    results = []
-    for workflow in workflows:
-        ordered_steps = sorted(workflow.steps, key=lambda s: s.step_order)
-        context: Dict[Any, Any] = {"trigger": data}
-        for step in ordered_steps:
-            if step.type == "action" and step.service == service and step.event == event_type:
-                context[step.step_order] = data
-
-        for step in ordered_steps:
+    runnable.sort(key=lambda s: s.type != "action")
+    action_tasks: Dict[int, asyncio.Task] = {}
+
+    async def run_node(step: CompiledStep, dependencies: list):
+        if dependencies:
+            await asyncio.gather(*dependencies)
+        started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            output, result = await run_step(step, db, user_id, step.resolve_params(context, data))
+        if step.type == "action":
+            context[step.step_order] = output
+        elif completed is not None and result["success"]:
+            completed.add(step.step_order)
+        if step_runs is not None:
+            step_runs.append((step, result, output, started_at, time.perf_counter() - started))
+        return result
+
+    # Tasks copy the current context when created, so every step sees the prefetched tokens.
+    context_token = prefetched_tokens.set(tokens) if tokens is not None else None
+    try:
+        tasks = []
+        for step in runnable:
+            dependencies = [action_tasks[order] for order in step.dependencies if order in action_tasks]
+            task = asyncio.create_task(run_node(step, dependencies))
             if step.type == "action":
-                if step.service == service and step.event == event_type:
-                    continue
-
-                resolved_params = prepare_step_params(step.params, context, data, include_message_fallback=False)
-                try:
-                    action_output = await execute_action(step.service, step.event, db, workflow.user_id, resolved_params)
-                    context[step.step_order] = action_output
-                    results.append({
-                        "success": True,
-                        "step": f"{step.service}.{step.event}",
-                        "result": action_output
-                    })
-                except NotImplementedError as exc:
-                    context[step.step_order] = None
-                    results.append({
-                        "success": False,
-                        "step": f"{step.service}.{step.event}",
-                        "error": f"Not implemented: {exc}"
-                    })
-                except Exception as exc:
-                    context[step.step_order] = None
-                    results.append({
-                        "success": False,
-                        "step": f"{step.service}.{step.event}",
-                        "error": str(exc)
-                    })
-
-        for step in ordered_steps:
-            if step.type != "reaction":
-                continue
+                action_tasks[step.step_order] = task
+            tasks.append(task)
+    finally:
+        if context_token is not None:
+            prefetched_tokens.reset(context_token)
+
+    return list(await asyncio.gather(*tasks))
+
+
+def refresh_workflow_caches(workflow: Workflow):
+    trigger_index.update_workflow(workflow)
+    plan_cache.evict(workflow.id)
+    timer_scheduler.update_workflow(workflow)
+
+
+def evict_workflow_caches(workflow_id: int):
+    trigger_index.remove_workflow(workflow_id)
+    plan_cache.evict(workflow_id)
+    timer_scheduler.remove_workflow(workflow_id)
+
+
+async def load_workflow_plans(db: AsyncSession, workflow_ids: list[int]) -> Dict[int, tuple[Workflow, WorkflowPlan]]:
+    """Load active workflows with their steps in two queries and return their plans by id."""
+    result = await db.execute(
+        select(Workflow)
+        .options(selectinload(Workflow.steps))
+        .where(Workflow.id.in_(workflow_ids), Workflow.active == True)
+    )
+    workflows = result.scalars().all()
+    return {workflow.id: (workflow, plan_cache.get(workflow)) for workflow in workflows}
 
-            resolved_params = prepare_step_params(step.params, context, data, include_message_fallback=True)
-            try:
-                result = await execute_reaction(step.service, step.event, db, workflow.user_id, resolved_params)
-                results.append({
-                    "success": True,
-                    "step": f"{step.service}.{step.event}",
-                    "result": result
-                })
-            except NotImplementedError as exc:
-                results.append({
-                    "success": False,
-                    "step": f"{step.service}.{step.event}",
-                    "error": f"Not implemented: {exc}"
-                })
-            except Exception as exc:
-                results.append({
-                    "success": False,
-                    "step": f"{step.service}.{step.event}",
-                    "error": str(exc)
-                })
 
+async def run_workflow(plan: WorkflowPlan, user_id: int, service: str, event_type: str, data: dict, tokens: Dict[TokenKey, Any] | None = None, completed: set[int] | None = None):
+    started_at = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    step_runs = []
+    results = await execute_plan(plan, user_id, service, event_type, data, step_runs, tokens, completed)
+    step_runs.sort(key=lambda record: (record[0].type != "action", record[0].step_order))
+    run_history.record(plan.workflow_id, user_id, service, event_type, started_at, time.perf_counter() - started, step_runs)
     return results
 
 
-async def create_steps_for_workflow(db: Session, workflow_id: int, steps: list, user_id: int):
-    print(f"[logs] create_steps_for_workflow called: workflow_id={workflow_id} user_id={user_id} steps_count={len(steps)}")
-    created_steps = []
+async def dispatch_event(service: str, event_type: str, data: dict, db: AsyncSession, workflow_ids: list[int] | None = None, completed: Dict[int, set[int]] | None = None):
+    """Run every workflow routed to this event and return (WorkflowRef, results) pairs in workflow id order.
+
+    Workflows, their steps and the provider tokens their plans need for this
+    trigger are loaded up front with a fixed number of queries, whatever the
+    number of matched workflows and steps. `completed` maps workflow ids to
+    the reactions already done for this event (see execute_plan).
+
+    The caller's transaction is committed before the workflows start, so its
+    connection goes back to the pool instead of being held for the whole run.
+    """
+    if trigger_index.ready:
+        refs = trigger_index.resolve(service, event_type, data)
+    else:
+        refs = await find_trigger_refs(db, service, event_type, data)
+    if workflow_ids is not None:
+        wanted = set(workflow_ids)
+        refs = [ref for ref in refs if ref.workflow_id in wanted]
+    if not refs:
+        return []
+
+    loaded = await load_workflow_plans(db, [ref.workflow_id for ref in refs])
+    refs = [ref for ref in refs if ref.workflow_id in loaded]
+    if not refs:
+        return []
+    tokens = await prefetch_tokens(db, {
+        (workflow.user_id, provider)
+        for workflow, plan in loaded.values()
+        for provider in plan.token_providers(service, event_type)
+    })
+    await db.commit()
+
+    def run(ref):
+        workflow, plan = loaded[ref.workflow_id]
+        done = completed.setdefault(ref.workflow_id, set()) if completed is not None else None
+        return workflow_limiter.run(workflow.user_id, run_workflow(plan, workflow.user_id, service, event_type, data, tokens, done))
+
+    runs = await asyncio.gather(*(run(ref) for ref in refs), return_exceptions=True)
+
+    outcomes = []
+    for ref, outcome in zip(refs, runs):
+        if isinstance(outcome, BaseException):
+            logger.error("Workflow %s failed on %s.%s: %s", ref.workflow_id, service, event_type, outcome)
+            outcome = [{
+                "success": False,
+                "step": f"workflow.{ref.workflow_id}",
+                "error": str(outcome)
+            }]
+        outcomes.append((ref, outcome))
+    return outcomes
+
+
+async def trigger_workflows(service: str, event_type: str, data: dict, db: AsyncSession):
+    outcomes = await dispatch_event(service, event_type, data, db)
+    return [result for _, results in outcomes for result in results]
+
+
+def build_steps_for_workflow(workflow_id: int | None, steps: list) -> list[WorkflowStep]:
+    """Translate client steps into unsaved WorkflowStep rows and reject invalid plans.
+
+    `workflow_id` is None when validating a new workflow; the caller sets it once the row exists.
+    """
     id_to_index: Dict[str, int] = {}
 
     for idx, step in enumerate(steps):
@@ -169,51 +215,70 @@ async def create_steps_for_workflow(db: Session, workflow_id: int, steps: list,
             id_to_index[client_id] = idx
             print(f"[logs] Registered client step: client_id={client_id} -> index={idx}")
 
+    pending_steps = []
     for idx, step in enumerate(steps):
-        try:
-            params_payload = deepcopy(step.params) if step.params else {}
-            links_payload = getattr(step, "links", None) or {}
-            print(f"[logs] Processing step index={idx} type={step.type} service={step.service} event={step.event}")
-
-            for param_name, link_info in links_payload.items():
-                if not isinstance(link_info, dict):
-                    continue
-
-                source_client_id = link_info.get("source")
-                path = link_info.get("path") or link_info.get("field")
-                if not source_client_id or not path:
-                    continue
-
-                source_index = id_to_index.get(source_client_id)
-                if source_index is None:
-                    continue
-
-                fallback = link_info.get("fallback")
-                existing_value = params_payload.get(param_name)
-                if fallback is None and existing_value not in (None, "", [], {}):
-                    fallback = existing_value
-
-                print(
-                    f"[logs] Linking param: step_index={idx} param={param_name} "
-                    f"source_index={source_index} path={path} fallback={fallback}"
-                )
-                link_payload: Dict[str, Any] = {
-                    "source_step": source_index,
-                    "path": path
-                }
-                if fallback not in (None, "", [], {}):
-                    link_payload["fallback"] = fallback
-
-                params_payload[param_name] = {"__link": link_payload}
-
-            db_step = WorkflowStep(
-                workflow_id=workflow_id,
-                step_order=idx,
-                type=step.type,
-                service=step.service,
-                event=step.event,
-                params=params_payload
+        params_payload = deepcopy(step.params) if step.params else {}
+        links_payload = getattr(step, "links", None) or {}
+        print(f"[logs] Processing step index={idx} type={step.type} service={step.service} event={step.event}")
+
+        for param_name, link_info in links_payload.items():
+            if not isinstance(link_info, dict):
+                continue
+
+            source_client_id = link_info.get("source")
+            path = link_info.get("path") or link_info.get("field")
+            if not source_client_id or not path:
+                continue
+
+            source_index = id_to_index.get(source_client_id)
+            if source_index is None:
+                continue
+
+            fallback = link_info.get("fallback")
+            existing_value = params_payload.get(param_name)
+            if fallback is None and existing_value not in (None, "", [], {}):
+                fallback = existing_value
+
+            print(
+                f"[logs] Linking param: step_index={idx} param={param_name} "
+                f"source_index={source_index} path={path} fallback={fallback}"
             )
+            link_payload: Dict[str, Any] = {
+                "source_step": source_index,
+                "path": path
+            }
+            if fallback not in (None, "", [], {}):
+                link_payload["fallback"] = fallback
+
+            params_payload[param_name] = {"__link": link_payload}
+
+        pending_steps.append(WorkflowStep(
+            workflow_id=workflow_id,
+            step_order=idx,
+            type=step.type,
+            service=step.service,
+            event=step.event,
+            params=params_payload,
+            trigger_key=routing_key_for_params(step.service, params_payload) if step.type == "action" else None
+        ))
+
+    try:
+        validate_steps(pending_steps)
+    except WorkflowPlanError as exc:
+        print(f"[logs] Rejected workflow steps: workflow_id={workflow_id} errors={exc.errors}")
+        raise HTTPException(status_code=400, detail=f"Invalid workflow: {exc}")
+    return pending_steps
+
+
+async def create_steps_for_workflow(db: AsyncSession, workflow_id: int, steps: list, user_id: int, pending_steps: list[WorkflowStep] | None = None):
+    print(f"[logs] create_steps_for_workflow called: workflow_id={workflow_id} user_id={user_id} steps_count={len(steps)}")
+    if pending_steps is None:
+        pending_steps = build_steps_for_workflow(workflow_id, steps)
+
+    created_steps = []
+    acquired: list[str] = []
+    for idx, (step, db_step) in enumerate(zip(steps, pending_steps)):
+        try:
             db.add(db_step)
             print(
                 f"[logs] Added workflow step to session: workflow_id={workflow_id} "
@@ -229,33 +294,47 @@ async def create_steps_for_workflow(db: Session, workflow_id: int, steps: list,
                     raise ValueError("Missing 'username_streamer' in params")
 
                 broadcaster_id = await get_twitch_user_id(username)
-                existing_id = await get_existing_twitch_webhook_id(step.event, broadcaster_id)
-                if existing_id:
-                    db_step.params["webhook_id"] = existing_id
-                else:
-                    webhook_id = await create_twitch_webhook(step.event, broadcaster_id, db, user_id)
-                    db_step.params["webhook_id"] = webhook_id
+                webhook_id = await acquire_twitch_subscription(step.event, broadcaster_id)
+                acquired.append(webhook_id)
+                db_step.params["webhook_id"] = webhook_id
             created_steps.append(db_step)
             print(f"[logs] Step index={idx} appended to created_steps")
         except Exception as exc:
             print(f"[logs] Error while creating step index={idx}: {exc}")
+            await release_twitch_subscriptions(acquired)
             raise HTTPException(
                 status_code=500,
                 detail=f"Failed to create step {idx} ({step.service}.{step.event}): {exc}"
             )
 
-    db.commit()
+    await db.commit()
     return created_steps
 
 
-async def delete_steps_for_workflow(db: Session, workflow, user_id: int):
+def twitch_webhook_ids(steps) -> list[str]:
+    return [
+        step.params["webhook_id"]
+        for step in steps
+        if step.type == "action" and step.service == "twitch" and step.params and step.params.get("webhook_id")
+    ]
+
+
+async def release_twitch_subscriptions(webhook_ids: list[str]):
+    for webhook_id in webhook_ids:
+        try:
+            await release_twitch_subscription(webhook_id)
+        except Exception as exc:
+            print(f"Failed to release Twitch webhook {webhook_id}: {exc}")
+
+
+async def delete_steps_for_workflow(db: AsyncSession, workflow) -> list[str]:
+    """Delete the workflow's steps (loaded by the caller) and return the Twitch subscriptions they held.
+
+    The caller releases them once the replacement steps hold their own
+    references, so an edit that keeps a Twitch trigger never touches Twitch.
+    """
+    webhook_ids = twitch_webhook_ids(workflow.steps)
     for step in workflow.steps:
-        if step.type == "action" and step.service == "twitch":
-            webhook_id = step.params.get("webhook_id") if step.params else None
-            if webhook_id:
-                try:
-                    await delete_twitch_webhook(db, user_id, webhook_id)
-                except Exception as exc:
-                    print(f"Failed to delete Twitch webhook {webhook_id}: {exc}")
-        db.delete(step)
-    db.commit()
\ No newline at end of file
+        await db.delete(step)
+    await db.commit()
+    return webhook_ids
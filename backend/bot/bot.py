@@ -1,14 +1,36 @@
+import asyncio
+import uuid
 import discord
 import requests
 from app.config import settings
 
 BACKEND_URL = "https://trigger.ink/actions/discord"
+SEND_ATTEMPTS = 2
+MEMBER_UPDATE_COALESCE_SECONDS = settings.MEMBER_UPDATE_COALESCE_SECONDS
 
 intents = discord.Intents.default()
 intents.members = True
 intents.message_content = True
 
 client = discord.Client(intents=intents)
+pending_member_updates = {}
+
+def make_event_id(*parts) -> str:
+    """Stable id for an event, reused if the same payload is sent again."""
+    return ":".join(str(part) for part in parts)
+
+def send_event(payload: dict, sent_label: str, error_label: str):
+    headers = {"bot-token": settings.BOT_SECRET}
+    for attempt in range(SEND_ATTEMPTS):
+        try:
+            response = requests.post(BACKEND_URL, json=payload, headers=headers, timeout=5)
+            print(f"{sent_label}: {response.status_code} {response.text}")
+            return
+        except (requests.Timeout, requests.ConnectionError) as e:
+            print(f"{error_label} (attempt {attempt + 1}/{SEND_ATTEMPTS}): {e}")
+        except Exception as e:
+            print(f"{error_label}: {e}")
+            return
 
 @client.event
 async def on_ready():
@@ -16,8 +38,10 @@ async def on_ready():
 
 @client.event
 async def on_member_join(member):
+    joined_at = member.joined_at.timestamp() if member.joined_at else uuid.uuid4().hex
     payload = {
         "event": "member_join",
+        "event_id": make_event_id("member_join", member.guild.id, member.id, joined_at),
         "guild_id": str(member.guild.id),
         "user": {
             "id": str(member.id),
@@ -27,17 +51,13 @@ async def on_member_join(member):
         },
         "message": f"Welcome, {member.display_name}!"
     }
-    headers = {"bot-token": settings.BOT_SECRET}
-    try:
-        response = requests.post(BACKEND_URL, json=payload, headers=headers, timeout=5)
-        print(f"Sent event to backend: {response.status_code} {response.text}")
-    except Exception as e:
-        print(f"Error sending event to backend: {e}")
+    await asyncio.to_thread(send_event, payload, "Sent event to backend", "Error sending event to backend")
 
 @client.event
 async def on_member_remove(member):
     payload = {
         "event": "member_remove",
+        "event_id": make_event_id("member_remove", member.guild.id, member.id, uuid.uuid4().hex),
         "guild_id": str(member.guild.id),
         "user": {
             "id": str(member.id),
@@ -47,15 +67,9 @@ async def on_member_remove(member):
         },
         "message": f"Goodbye, {member.display_name}!"
     }
-    headers = {"bot-token": settings.BOT_SECRET}
-    try:
-        response = requests.post(BACKEND_URL, json=payload, headers=headers, timeout=5)
-        print(f"Sent event to backend: {response.status_code} {response.text}")
-    except Exception as e:
-        print(f"Error sending event to backend: {e}")
+    await asyncio.to_thread(send_event, payload, "Sent event to backend", "Error sending event to backend")
 
-@client.event
-async def on_member_update(before, after):
+def describe_member_changes(before, after):
     change_records = []
     summary_parts = []
 
@@ -120,10 +134,15 @@ async def on_member_update(before, after):
         else:
             summary_parts.append("timeout removed")
 
+    return change_records, summary_parts
+
+async def send_member_update(before, after):
+    change_records, summary_parts = describe_member_changes(before, after)
     print("Detected member update:", change_records)
     if change_records:
         payload = {
             "event": "member_update",
+            "event_id": make_event_id("member_update", after.guild.id, after.id, uuid.uuid4().hex),
             "guild_id": str(after.guild.id),
             "user": {
                 "id": str(after.id),
@@ -141,12 +160,29 @@ async def on_member_update(before, after):
         if summary_parts:
             payload["message"] = ", ".join(summary_parts)
 
-        headers = {"bot-token": settings.BOT_SECRET}
-        try:
-            response = requests.post(BACKEND_URL, json=payload, headers=headers, timeout=5)
-            print(f"Sent member update to backend: {response.status_code} {response.text}")
-        except Exception as e:
-            print(f"Error sending member update to backend: {e}")
+        await asyncio.to_thread(send_event, payload, "Sent member update to backend", "Error sending member update to backend")
+
+@client.event
+async def on_member_update(before, after):
+    # Gateway updates (activity changes especially) come in bursts: keep the
+    # first `before` and the latest `after` per member for the coalescing window
+    # and send a single event with the net changes.
+    if MEMBER_UPDATE_COALESCE_SECONDS <= 0:
+        await send_member_update(before, after)
+        return
+
+    key = (after.guild.id, after.id)
+    pending = pending_member_updates.get(key)
+    if pending is not None:
+        pending[1] = after
+        return
+
+    pending_member_updates[key] = [before, after]
+    try:
+        await asyncio.sleep(MEMBER_UPDATE_COALESCE_SECONDS)
+    finally:
+        before, after = pending_member_updates.pop(key)
+    await send_member_update(before, after)
 
 @client.event
 async def on_message(message):
@@ -156,6 +192,7 @@ async def on_message(message):
     if client.user and client.user in message.mentions:
         payload = {
             "event": "bot_mention",
+            "event_id": make_event_id("bot_mention", message.id),
             "guild_id": str(message.guild.id) if message.guild else None,
             "channel_id": str(message.channel.id),
             "message_id": str(message.id),
@@ -167,11 +204,6 @@ async def on_message(message):
             "content": message.content,
             "created_at": message.created_at.isoformat()
         }
-        headers = {"bot-token": settings.BOT_SECRET}
-        try:
-            response = requests.post(BACKEND_URL, json=payload, headers=headers, timeout=5)
-            print(f"Sent bot mention to backend: {response.status_code} {response.text}")
-        except Exception as e:
-            print(f"Error sending bot mention to backend: {e}")
+        await asyncio.to_thread(send_event, payload, "Sent bot mention to backend", "Error sending bot mention to backend")
 
 client.run(settings.TOKEN_BOT_DISCORD)
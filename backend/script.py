@@ -28,6 +28,7 @@ action_step = WorkflowStep(
     service="discord",
     event="member_join",
     params=discord_action_params,
+    trigger_key=discord_action_params["guild_id"],
     step_order=1
 )
 db.add(action_step)
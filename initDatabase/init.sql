@@ -36,9 +36,11 @@ CREATE TABLE IF NOT EXISTS workflow_steps (
   service VARCHAR(100) NOT NULL,
   event VARCHAR(100) NOT NULL,
   params JSON NULL,
+  trigger_key VARCHAR(255) NULL,
   created_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
   PRIMARY KEY (id),
   KEY idx_steps_workflow_order (workflow_id, step_order),
+  KEY idx_steps_routing (type, service, event, trigger_key),
   CONSTRAINT fk_step_workflow FOREIGN KEY (workflow_id) REFERENCES workflows(id) ON DELETE CASCADE
 ) DEFAULT CHARSET=utf8mb4;
 
@@ -75,5 +77,75 @@ CREATE TABLE IF NOT EXISTS user_services (
   PRIMARY KEY (id),
   UNIQUE KEY uk_user_service (user_id, service_key),
   KEY idx_us_user (user_id),
+  KEY idx_us_token_expires (token_expires_at),
   CONSTRAINT fk_us_user FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 ) DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS workflow_events (
+  id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
+  service VARCHAR(100) NOT NULL,
+  event_type VARCHAR(100) NULL,
+  payload JSON NOT NULL,
+  status ENUM('pending','processing','done','dead') NOT NULL DEFAULT 'pending',
+  attempts INT NOT NULL DEFAULT 0,
+  workflow_ids JSON NULL,
+  completed_steps JSON NULL,
+  available_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+  locked_at DATETIME(6) NULL,
+  last_error TEXT NULL,
+  created_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+  updated_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+  PRIMARY KEY (id),
+  KEY idx_events_claim (status, available_at)
+) DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS workflow_runs (
+  id CHAR(32) NOT NULL,
+  workflow_id BIGINT UNSIGNED NOT NULL,
+  user_id BIGINT UNSIGNED NOT NULL,
+  service VARCHAR(100) NOT NULL,
+  event_type VARCHAR(100) NULL,
+  status ENUM('success','failed') NOT NULL,
+  started_at DATETIME(6) NOT NULL,
+  duration_ms INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (id),
+  KEY idx_runs_workflow_started (workflow_id, started_at),
+  KEY idx_runs_user_started (user_id, started_at)
+) DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS workflow_step_runs (
+  id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
+  run_id CHAR(32) NOT NULL,
+  step_order INT NOT NULL,
+  type ENUM('action','reaction','transformation') NOT NULL,
+  service VARCHAR(100) NOT NULL,
+  event VARCHAR(100) NOT NULL,
+  status ENUM('success','failed') NOT NULL,
+  started_at DATETIME(6) NOT NULL,
+  duration_ms INT NOT NULL DEFAULT 0,
+  error TEXT NULL,
+  output TEXT NULL,
+  PRIMARY KEY (id),
+  KEY idx_step_runs_run (run_id, step_order),
+  CONSTRAINT fk_step_run_run FOREIGN KEY (run_id) REFERENCES workflow_runs(id) ON DELETE CASCADE
+) DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS processed_events (
+  event_key VARCHAR(191) NOT NULL,
+  expires_at DATETIME(6) NOT NULL,
+  PRIMARY KEY (event_key),
+  KEY ix_processed_events_expires_at (expires_at)
+) DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS twitch_subscriptions (
+  id VARCHAR(64) NOT NULL,
+  type VARCHAR(100) NOT NULL,
+  broadcaster_id VARCHAR(64) NOT NULL,
+  callback VARCHAR(255) NOT NULL,
+  status VARCHAR(64) NOT NULL,
+  ref_count INT NOT NULL DEFAULT 0,
+  created_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+  updated_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+  PRIMARY KEY (id),
+  UNIQUE KEY uq_twitch_subscription (type, broadcaster_id, callback)
+) DEFAULT CHARSET=utf8mb4;
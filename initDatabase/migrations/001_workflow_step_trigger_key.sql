@@ -0,0 +1,28 @@
+USE area;
+
+-- Materialize the trigger routing key (guild_id / username_streamer / player_id)
+-- out of workflow_steps.params so event routing can use an index seek.
+
+ALTER TABLE workflow_steps
+  ADD COLUMN IF NOT EXISTS trigger_key VARCHAR(255) NULL AFTER params;
+
+CREATE INDEX IF NOT EXISTS idx_steps_routing
+  ON workflow_steps (type, service, event, trigger_key);
+
+CREATE INDEX IF NOT EXISTS idx_steps_workflow_order
+  ON workflow_steps (workflow_id, step_order);
+
+UPDATE workflow_steps
+SET trigger_key = NULLIF(TRIM(JSON_UNQUOTE(JSON_EXTRACT(params, '$.guild_id'))), '')
+WHERE type = 'action' AND service = 'discord' AND trigger_key IS NULL
+  AND JSON_TYPE(JSON_EXTRACT(params, '$.guild_id')) IN ('STRING', 'INTEGER', 'DOUBLE');
+
+UPDATE workflow_steps
+SET trigger_key = NULLIF(LOWER(TRIM(JSON_UNQUOTE(JSON_EXTRACT(params, '$.username_streamer')))), '')
+WHERE type = 'action' AND service = 'twitch' AND trigger_key IS NULL
+  AND JSON_TYPE(JSON_EXTRACT(params, '$.username_streamer')) IN ('STRING', 'INTEGER', 'DOUBLE');
+
+UPDATE workflow_steps
+SET trigger_key = NULLIF(TRIM(JSON_UNQUOTE(JSON_EXTRACT(params, '$.player_id'))), '')
+WHERE type = 'action' AND service = 'faceit' AND trigger_key IS NULL
+  AND JSON_TYPE(JSON_EXTRACT(params, '$.player_id')) IN ('STRING', 'INTEGER', 'DOUBLE');
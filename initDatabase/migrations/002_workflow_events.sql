@@ -0,0 +1,21 @@
+USE area;
+
+-- Durable outbox for incoming trigger events (EVENT_INGESTION_MODE=durable).
+
+CREATE TABLE IF NOT EXISTS workflow_events (
+  id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
+  service VARCHAR(100) NOT NULL,
+  event_type VARCHAR(100) NULL,
+  payload JSON NOT NULL,
+  status ENUM('pending','processing','done','dead') NOT NULL DEFAULT 'pending',
+  attempts INT NOT NULL DEFAULT 0,
+  workflow_ids JSON NULL,
+  completed_steps JSON NULL,
+  available_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+  locked_at DATETIME(6) NULL,
+  last_error TEXT NULL,
+  created_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+  updated_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+  PRIMARY KEY (id),
+  KEY idx_events_claim (status, available_at)
+) DEFAULT CHARSET=utf8mb4;
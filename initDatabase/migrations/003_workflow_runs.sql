@@ -0,0 +1,34 @@
+USE area;
+
+-- Workflow execution history written by app.services.run_history.
+
+CREATE TABLE IF NOT EXISTS workflow_runs (
+  id CHAR(32) NOT NULL,
+  workflow_id BIGINT UNSIGNED NOT NULL,
+  user_id BIGINT UNSIGNED NOT NULL,
+  service VARCHAR(100) NOT NULL,
+  event_type VARCHAR(100) NULL,
+  status ENUM('success','failed') NOT NULL,
+  started_at DATETIME(6) NOT NULL,
+  duration_ms INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (id),
+  KEY idx_runs_workflow_started (workflow_id, started_at),
+  KEY idx_runs_user_started (user_id, started_at)
+) DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS workflow_step_runs (
+  id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
+  run_id CHAR(32) NOT NULL,
+  step_order INT NOT NULL,
+  type ENUM('action','reaction','transformation') NOT NULL,
+  service VARCHAR(100) NOT NULL,
+  event VARCHAR(100) NOT NULL,
+  status ENUM('success','failed') NOT NULL,
+  started_at DATETIME(6) NOT NULL,
+  duration_ms INT NOT NULL DEFAULT 0,
+  error TEXT NULL,
+  output TEXT NULL,
+  PRIMARY KEY (id),
+  KEY idx_step_runs_run (run_id, step_order),
+  CONSTRAINT fk_step_run_run FOREIGN KEY (run_id) REFERENCES workflow_runs(id) ON DELETE CASCADE
+) DEFAULT CHARSET=utf8mb4;
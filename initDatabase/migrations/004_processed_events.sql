@@ -0,0 +1,10 @@
+USE area;
+
+-- Shared dedupe store for provider message ids (EVENT_DEDUPE_BACKEND=database).
+
+CREATE TABLE IF NOT EXISTS processed_events (
+  event_key VARCHAR(191) NOT NULL,
+  expires_at DATETIME(6) NOT NULL,
+  PRIMARY KEY (event_key),
+  KEY ix_processed_events_expires_at (expires_at)
+) DEFAULT CHARSET=utf8mb4;
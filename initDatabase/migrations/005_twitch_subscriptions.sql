@@ -0,0 +1,16 @@
+USE area;
+
+-- Local mirror of the EventSub subscriptions pointing at our callback, so
+-- existence checks are an indexed lookup instead of listing them from Twitch.
+
+CREATE TABLE IF NOT EXISTS twitch_subscriptions (
+  id VARCHAR(64) NOT NULL,
+  type VARCHAR(100) NOT NULL,
+  broadcaster_id VARCHAR(64) NOT NULL,
+  callback VARCHAR(255) NOT NULL,
+  status VARCHAR(64) NOT NULL,
+  created_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+  updated_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+  PRIMARY KEY (id),
+  UNIQUE KEY uq_twitch_subscription (type, broadcaster_id, callback)
+) DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,15 @@
+USE area;
+
+-- Number of workflow steps sharing each EventSub subscription; Twitch is only
+-- called when the first step subscribes and after the last one is removed.
+
+ALTER TABLE twitch_subscriptions
+  ADD COLUMN IF NOT EXISTS ref_count INT NOT NULL DEFAULT 0 AFTER status;
+
+UPDATE twitch_subscriptions s
+SET ref_count = (
+  SELECT COUNT(*)
+  FROM workflow_steps w
+  WHERE w.type = 'action' AND w.service = 'twitch'
+    AND JSON_UNQUOTE(JSON_EXTRACT(w.params, '$.webhook_id')) = s.id
+);
@@ -0,0 +1,6 @@
+USE area;
+
+-- Lets the background token refresher find tokens about to expire with a range scan.
+
+CREATE INDEX IF NOT EXISTS idx_us_token_expires
+  ON user_services (token_expires_at);
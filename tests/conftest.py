@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# The backend is not installed as a package; its modules import as `app.*`.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("SECRET_KEY", "test-secret")
+# app.database builds its MySQL engines at import; tests bind the sessions to SQLite instead.
+for name, value in (("DB_HOST", "localhost"), ("DB_PORT", "3306"), ("DB_NAME", "area"), ("DB_USER", "area"), ("DB_PASSWORD", "area")):
+    os.environ.setdefault(name, value)
+os.environ.setdefault("MEDIA_ROOT", tempfile.mkdtemp(prefix="area-media-"))
@@ -0,0 +1,94 @@
+"""dispatch_event must load workflows, steps and tokens with a fixed number of queries."""
+import asyncio
+import json
+import time
+
+import pytest
+from sqlalchemy import BigInteger, event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.pool import StaticPool
+
+from app.database import AsyncSessionLocal, Base
+from app.models.models import User, UserService, Workflow, WorkflowStep
+from app.services import workflows
+from app.services.reactions import REACTION_DISPATCH
+from app.services.token_cache import token_cache
+from app.services.token_storage import refresh_oauth_token
+from app.services.workflow_plans import plan_cache
+
+
+@compiles(BigInteger, "sqlite")
+def _sqlite_big_integer(type_, compiler, **kw):
+    # SQLite only autoincrements INTEGER PRIMARY KEY columns.
+    return "INTEGER"
+
+
+async def play_track(db, user_id: int, params: dict):
+    token = await refresh_oauth_token(db, user_id, "spotify")
+    return {"token": token and token["access_token"]}
+
+play_track.token_provider = "spotify"
+
+
+def seed(db, count: int):
+    for idx in range(count):
+        user = User(username=f"user{idx}", email=f"user{idx}@example.com", password_hash="x")
+        db.add(user)
+        db.flush()
+        # Half of the owners have no token, which must not cost extra queries either.
+        if idx % 2 == 0:
+            db.add(UserService(
+                user_id=user.id,
+                service_key="spotify",
+                token_data=json.dumps({"access_token": f"token{user.id}", "expires_at": time.time() + 3600}),
+                token_iv=b"",
+                token_tag=b"",
+            ))
+        workflow = Workflow(user_id=user.id, name=f"workflow{idx}")
+        db.add(workflow)
+        db.flush()
+        db.add(WorkflowStep(workflow_id=workflow.id, step_order=0, type="action", service="discord", event="member_join", params={"guild_id": "1"}, trigger_key="1"))
+        db.add(WorkflowStep(workflow_id=workflow.id, step_order=1, type="reaction", service="spotify", event="play_track", params={}))
+
+
+async def count_dispatch_queries(count: int) -> tuple[int, list]:
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    AsyncSessionLocal.configure(bind=engine)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSessionLocal() as db:
+            await db.run_sync(seed, count)
+            await db.commit()
+
+        queries = []
+        event.listen(engine.sync_engine, "before_cursor_execute", lambda conn, cursor, statement, *args: queries.append(statement))
+        async with AsyncSessionLocal() as db:
+            outcomes = await workflows.dispatch_event("discord", "member_join", {"guild_id": "1"}, db)
+        return len(queries), outcomes
+    finally:
+        await engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def isolated_caches(monkeypatch):
+    monkeypatch.setitem(REACTION_DISPATCH, ("spotify", "play_track"), play_track)
+    monkeypatch.setattr(workflows.trigger_index, "ready", False)
+    monkeypatch.setattr(workflows.run_history, "record", lambda *args, **kwargs: None)
+    plan_cache.clear()
+    token_cache._entries.clear()
+    yield
+    plan_cache.clear()
+    token_cache._entries.clear()
+
+
+@pytest.mark.parametrize("count", [3, 12])
+def test_dispatch_query_count_does_not_grow_with_matched_workflows(count):
+    queries, outcomes = asyncio.run(count_dispatch_queries(count))
+
+    assert len(outcomes) == count
+    tokens = sorted(results[-1]["result"]["token"] or "" for _, results in outcomes)
+    assert tokens.count("") == count // 2
+    # Trigger refs, workflows, their steps and the owners' tokens.
+    assert queries == 4